@@ -0,0 +1,232 @@
+"""Upload ingestion: request body into pooled buffers, audio into float32 without temp files"""
+import os
+import asyncio
+import logging
+
+from backend.scheduler import QueueFullError
+from backend.transcription import SAMPLE_RATE, TranscriptionError, DecoderUnavailableError, TRANSCRIBE_MAX_BYTES
+
+logger = logging.getLogger(__name__)
+
+# Одновременно принимаемых загрузок; память буферов не превышает AUDIO_BUFFERS * TRANSCRIBE_MAX_BYTES
+AUDIO_BUFFERS = int(os.environ.get("AUDIO_BUFFERS", 4))
+AUDIO_BUFFER_INITIAL = int(os.environ.get("AUDIO_BUFFER_INITIAL", 1024 * 1024))
+# Ограничение на декодированный сигнал: сжатый Opus в 25 МБ - это часы PCM
+AUDIO_MAX_SECONDS = float(os.environ.get("AUDIO_MAX_SECONDS", 600))
+
+
+class BodyTooLargeError(Exception):
+    pass
+
+
+class AudioBuffer:
+    """Growable bytearray that keeps its capacity between requests"""
+
+    def __init__(self, limit, initial=AUDIO_BUFFER_INITIAL):
+        self.limit = limit
+        self.data = bytearray(min(initial, limit))
+        self.size = 0
+
+    def append(self, chunk):
+        end = self.size + len(chunk)
+        if end > self.limit:
+            raise BodyTooLargeError(f"Body exceeds {self.limit} bytes")
+        if end > len(self.data):
+            # Удваиваем емкость, но не выше лимита
+            self.data.extend(bytes(min(self.limit, max(end, 2 * len(self.data))) - len(self.data)))
+        self.data[self.size:end] = chunk
+        self.size = end
+
+    async def read_from(self, request):
+        """Copy the request body in as it arrives from the socket"""
+        length = request.headers.get("content-length")
+        if length is not None and length.isdigit() and int(length) > self.limit:
+            raise BodyTooLargeError(f"Body exceeds {self.limit} bytes")
+        async for chunk in request.stream():
+            self.append(chunk)
+        return self.size
+
+    def view(self):
+        return memoryview(self.data)[:self.size]
+
+
+class AudioBufferPool:
+    """A fixed number of reusable upload buffers.
+
+    Uploads beyond `count` at once are rejected instead of allocating more,
+    so ingestion memory stays bounded no matter how many clients upload.
+    """
+
+    def __init__(self, count=AUDIO_BUFFERS, limit=TRANSCRIBE_MAX_BYTES):
+        self.count = count
+        self.limit = limit
+        self._free = []
+        self._created = 0
+        self.rejected = 0
+
+    def acquire(self):
+        if self._free:
+            buffer = self._free.pop()
+        elif self._created < self.count:
+            self._created += 1
+            buffer = AudioBuffer(self.limit)
+        else:
+            self.rejected += 1
+            raise QueueFullError("All audio upload buffers are busy", 1)
+        buffer.size = 0
+        return buffer
+
+    def release(self, buffer):
+        self._free.append(buffer)
+
+    def stats(self):
+        return {
+            "buffers": self._created,
+            "free": len(self._free),
+            "capacity_bytes": sum(len(b.data) for b in self._free),
+            "rejected": self.rejected,
+        }
+
+
+def multipart_boundary(content_type):
+    for param in content_type.split(";")[1:]:
+        name, _, value = param.strip().partition("=")
+        if name.lower() == "boundary":
+            return value.strip('"').encode("latin-1")
+    return None
+
+
+def find_multipart_file(buffer, boundary, field="file"):
+    """Locate the `field` part of a multipart body; returns (start, end, content type).
+
+    Searches the buffer in place, so the file bytes are never copied out.
+    """
+    data, size = buffer.data, buffer.size
+    delimiter = b"--" + boundary
+    position = data.find(delimiter, 0, size)
+    while position != -1:
+        headers_start = position + len(delimiter) + 2
+        headers_end = data.find(b"\r\n\r\n", headers_start, size)
+        if headers_end == -1:
+            break
+        next_part = data.find(b"\r\n" + delimiter, headers_end, size)
+        if next_part == -1:
+            break
+        headers = bytes(data[headers_start:headers_end]).decode("latin-1").lower()
+        if f'name="{field}"' in headers:
+            content_type = ""
+            for line in headers.split("\r\n"):
+                if line.startswith("content-type:"):
+                    content_type = line.split(":", 1)[1].strip()
+            return headers_end + 4, next_part, content_type
+        position = next_part + 2
+    return None
+
+
+def _wav_pcm(view):
+    """Samples of a mono/stereo 16 kHz PCM16 or float32 WAV, else None (leave it to ffmpeg)"""
+    import numpy as np
+
+    if len(view) < 12 or view[:4] != b"RIFF" or view[8:12] != b"WAVE":
+        return None
+    fmt = None
+    position = 12
+    while position + 8 <= len(view):
+        chunk_id = bytes(view[position:position + 4])
+        chunk_size = int.from_bytes(view[position + 4:position + 8], "little")
+        body = position + 8
+        if chunk_id == b"fmt ":
+            fmt = tuple(
+                int.from_bytes(view[body + start:body + end], "little")
+                for start, end in ((0, 2), (2, 4), (4, 8), (14, 16))
+            )
+        elif chunk_id == b"data" and fmt is not None:
+            tag, channels, rate, bits = fmt
+            if rate != SAMPLE_RATE or channels not in (1, 2):
+                return None
+            end = min(len(view), body + chunk_size)
+            if tag == 1 and bits == 16:
+                end -= (end - body) % (2 * channels)
+                samples = np.frombuffer(view[body:end], "<i2").astype(np.float32) / 32768.0
+            elif tag == 3 and bits == 32:
+                end -= (end - body) % (4 * channels)
+                samples = np.frombuffer(view[body:end], "<f4").astype(np.float32)
+            else:
+                return None
+            if channels == 2:
+                samples = samples.reshape(-1, 2).mean(axis=1, dtype=np.float32)
+            return samples
+        position = body + chunk_size + chunk_size % 2
+    return None
+
+
+async def _ffmpeg_pcm(view, max_samples):
+    """Decode any container through ffmpeg pipes; output is bounded by `max_samples`"""
+    import numpy as np
+
+    try:
+        process = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-nostdin", "-loglevel", "error", "-i", "pipe:0",
+            "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1",
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        )
+    except FileNotFoundError:
+        raise DecoderUnavailableError("ffmpeg is not installed")
+
+    async def feed():
+        try:
+            process.stdin.write(view)
+            await process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            process.stdin.close()
+
+    writer = asyncio.create_task(feed())
+    stderr = asyncio.create_task(process.stderr.read())
+    limit = max_samples * 2
+    output = bytearray()
+    try:
+        while True:
+            chunk = await process.stdout.read(65536)
+            if not chunk:
+                break
+            if len(output) + len(chunk) > limit:
+                raise TranscriptionError(f"Audio is longer than {max_samples / SAMPLE_RATE:g} s")
+            output += chunk
+        await writer
+        if await process.wait() != 0:
+            message = (await stderr).decode(errors="replace").strip()
+            raise TranscriptionError(f"ffmpeg failed: {message}")
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        writer.cancel()
+        stderr.cancel()
+    output = output[:len(output) - len(output) % 2]
+    return np.frombuffer(output, "<i2").astype(np.float32) / 32768.0
+
+
+async def decode_upload(view, content_type="", max_seconds=AUDIO_MAX_SECONDS):
+    """Turn uploaded bytes into mono 16 kHz float32 samples.
+
+    16 kHz WAV and raw `audio/pcm` (PCM16 mono 16 kHz) are read straight
+    from the buffer with np.frombuffer; everything else (webm, ogg, mp3)
+    is piped through ffmpeg.
+    """
+    import numpy as np
+
+    max_samples = int(max_seconds * SAMPLE_RATE)
+    content_type = content_type.split(";")[0].strip().lower()
+    if content_type in ("audio/pcm", "audio/l16"):
+        samples = np.frombuffer(view[:len(view) - len(view) % 2], "<i2").astype(np.float32) / 32768.0
+    else:
+        samples = _wav_pcm(view)
+        if samples is None:
+            samples = await _ffmpeg_pcm(view, max_samples)
+    if len(samples) > max_samples:
+        raise TranscriptionError(f"Audio is longer than {max_seconds:g} s")
+    if not len(samples):
+        raise TranscriptionError("No audio samples decoded")
+    return samples
@@ -0,0 +1,100 @@
+"""Exact-match answer cache keyed on the normalized question"""
+import os
+import re
+import sys
+import time
+from collections import OrderedDict
+
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", 2000))
+ANSWER_CACHE_MAX_BYTES = int(os.environ.get("ANSWER_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+ANSWER_CACHE_TTL = float(os.environ.get("ANSWER_CACHE_TTL", 24 * 3600))
+
+_PUNCT_RE = re.compile(r"[^\w\s]+")
+
+
+def normalize_question(text):
+    """Case, punctuation, whitespace and ё/е insensitive form of a question"""
+    text = text.lower().replace("ё", "е")
+    text = _PUNCT_RE.sub(" ", text).replace("_", " ")
+    return " ".join(text.split())
+
+
+def cache_key(question, model, prompt_version):
+    return f"{prompt_version}:{model}:{normalize_question(question)}"
+
+
+class AnswerCache:
+    """LRU cache with TTL and a memory bound on the stored answers"""
+
+    def __init__(self, max_entries=ANSWER_CACHE_MAX_ENTRIES,
+                 max_bytes=ANSWER_CACHE_MAX_BYTES, ttl=ANSWER_CACHE_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, answer, size)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, answer, size = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return answer
+
+    def set(self, key, answer, ttl=None):
+        """Store `answer`; `ttl` overrides the default lifetime, e.g. to keep
+        an answer copied from another cache from outliving the original"""
+        size = sys.getsizeof(key) + sys.getsizeof(answer)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        ttl = self.ttl if ttl is None else ttl
+        self._entries[key] = (time.monotonic() + ttl, answer, size)
+        self.bytes += size
+        while self._entries and (
+            len(self._entries) > self.max_entries or self.bytes > self.max_bytes
+        ):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def clear(self):
+        count = len(self._entries)
+        self._entries.clear()
+        self.bytes = 0
+        return count
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self.bytes -= size
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+answer_cache = AnswerCache()
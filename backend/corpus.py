@@ -0,0 +1,123 @@
+"""In-memory index of the bundled Constitution corpus"""
+import os
+import re
+import json
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CORPUS_PATH = os.environ.get(
+    "CONSTITUTION_CORPUS_PATH",
+    os.path.join(os.path.dirname(__file__), "data", "constitution_2022.json"),
+)
+
+
+@dataclass(frozen=True)
+class Article:
+    number: str
+    paragraphs: List[str]
+    section_number: str
+    section_title: str
+    chapter_number: Optional[str] = None
+    chapter_title: Optional[str] = None
+
+    @property
+    def text(self):
+        return "\n".join(self.paragraphs)
+
+    def to_dict(self):
+        return {
+            "number": self.number,
+            "paragraphs": list(self.paragraphs),
+            "section": {"number": self.section_number, "title": self.section_title},
+            "chapter": (
+                {"number": self.chapter_number, "title": self.chapter_title}
+                if self.chapter_number else None
+            ),
+        }
+
+
+class ConstitutionIndex:
+    """Articles of the Constitution keyed by article number ("24", "89-1")"""
+
+    def __init__(self, data):
+        self.title = data["title"]
+        self.edition = data.get("edition", "")
+        self.version = data["version"]
+        # Текст без сверки с официальной публикацией помечается явно
+        self.verified = bool(data.get("verified", False))
+        self.articles: Dict[str, Article] = {}
+        for section in data["sections"]:
+            chapters = section.get("chapters") or [
+                {"number": None, "title": None, "articles": section.get("articles", [])}
+            ]
+            for chapter in chapters:
+                for item in chapter["articles"]:
+                    self.articles[item["number"]] = Article(
+                        number=item["number"],
+                        paragraphs=item["paragraphs"],
+                        section_number=section["number"],
+                        section_title=section["title"],
+                        chapter_number=chapter["number"],
+                        chapter_title=chapter["title"],
+                    )
+
+    @classmethod
+    def load(cls, path=CORPUS_PATH):
+        with open(path, encoding="utf-8") as f:
+            index = cls(json.load(f))
+        logger.info(f"Constitution corpus v{index.version} loaded: {len(index.articles)} articles")
+        if not index.verified:
+            logger.warning("Constitution corpus text is not verified against the official publication")
+        return index
+
+    def get(self, number) -> Optional[Article]:
+        return self.articles.get(normalize_article_number(number))
+
+    def format_article(self, article: Article):
+        """Human-readable answer for a direct article request"""
+        location = f"Раздел {article.section_number}. {article.section_title}"
+        if article.chapter_number:
+            location += f", глава {article.chapter_number}. {article.chapter_title}"
+        paragraphs = "\n\n".join(
+            f"{i}. {p}" if len(article.paragraphs) > 1 else p
+            for i, p in enumerate(article.paragraphs, 1)
+        )
+        return (
+            f"Статья {article.number} Конституции Республики Беларусь ({location}):\n\n"
+            f"{paragraphs}\n\n"
+            f"Справка: это регулируется статьей {article.number} Конституции Республики Беларусь."
+        )
+
+
+@lru_cache(maxsize=1)
+def get_constitution() -> ConstitutionIndex:
+    return ConstitutionIndex.load()
+
+
+def normalize_article_number(number):
+    # "89.1", "89 1", "89–1" -> "89-1"
+    return re.sub(r"[\s.\-\u2010-\u2015]+", "-", str(number).strip())
+
+
+# "статья 24", "ст. 89-1", "что говорится в статье 24 Конституции?"
+_ARTICLE_REQUEST_RE = re.compile(
+    r"^(?:(?:что|о\s+ч[её]м)\s+(?:говорится|сказано|гласит|написано)\s+(?:в\s+)?"
+    r"|(?:покажи|процитируй|напомни|приведи|открой)(?:те)?\s+(?:текст\s+)?"
+    r"|текст\s+)?"
+    r"(?:статья|статье|статьи|статью|ст\.?)\s*№?\s*(\d{1,3}(?:[-.]\d{1,2})?)"
+    r"(?:\s+конституции(?:\s+(?:рб|республики\s+беларусь|беларуси))?)?"
+    r"\s*[?.!]*$"
+)
+
+
+def parse_article_request(message) -> Optional[str]:
+    """Return the article number if the message only asks for one article"""
+    text = " ".join(message.lower().split())
+    match = _ARTICLE_REQUEST_RE.match(text)
+    if not match:
+        return None
+    return normalize_article_number(match.group(1))
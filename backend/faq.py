@@ -0,0 +1,122 @@
+"""Canned answers for greetings and frequent questions"""
+import os
+import re
+import json
+import logging
+from collections import deque
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+FAQ_PATH = os.path.join(os.path.dirname(__file__), "data", "faq.json")
+
+FAQ_ENABLED = os.environ.get("FAQ_ENABLED", "1") == "1"
+
+_NON_WORD_RE = re.compile(r"[^а-яa-z0-9]+")
+
+
+def normalize_text(text):
+    """Lowercase, fold ё and collapse everything except letters and digits to single spaces"""
+    return _NON_WORD_RE.sub(" ", text.lower().replace("ё", "е")).strip()
+
+
+class AhoCorasick:
+    """Multi-pattern matcher: one pass over the text finds every pattern occurrence"""
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        # Переходы бора, суффиксные ссылки и выходы по состояниям
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for index, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = next_state
+            self._out[state].append(index)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._out[next_state] = self._out[next_state] + self._out[self._fail[next_state]]
+
+    def finditer(self, text):
+        """Yield (start, end, pattern_index) for every occurrence, overlaps included"""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for index in out[state]:
+                yield position + 1 - len(self.patterns[index]), position + 1, index
+
+
+class FAQMatcher:
+    """Match a message against FAQ intents with a single automaton scan.
+
+    Patterns are matched on whole words. A message gets a canned answer only
+    when the matched patterns plus filler words cover all of its words, so
+    "привет" is answered but "привет, какие права у пенсионеров" is not.
+    """
+
+    def __init__(self, intents, filler):
+        self.intents = intents
+        self.filler = frozenset(filler)
+        patterns = []
+        self._pattern_intent = []
+        for intent_index, intent in enumerate(intents):
+            for pattern in intent["patterns"]:
+                # Пробелы по краям - совпадение только по границам слов
+                patterns.append(f" {normalize_text(pattern)} ")
+                self._pattern_intent.append(intent_index)
+        self.automaton = AhoCorasick(patterns)
+
+    @classmethod
+    def load(cls, path=FAQ_PATH):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["intents"], data.get("filler", ()))
+
+    def match(self, message):
+        """Return the matched intent dict or None"""
+        text = f" {normalize_text(message)} "
+        if len(text) <= 2:
+            return None
+        covered = bytearray(len(text))
+        matched = set()
+        for start, end, index in self.automaton.finditer(text):
+            matched.add(self._pattern_intent[index])
+            covered[start:end] = b"\x01" * (end - start)
+        if not matched:
+            return None
+
+        # Все слова вне совпадений должны быть служебными
+        position = 0
+        for word in text.split(" "):
+            if word and not all(covered[position:position + len(word)]) and word not in self.filler:
+                return None
+            position += len(word) + 1
+
+        best = max(matched, key=lambda i: self.intents[i].get("priority", 0))
+        return self.intents[best]
+
+
+@lru_cache(maxsize=1)
+def get_faq():
+    faq = FAQMatcher.load()
+    logger.info(f"FAQ loaded: {len(faq.intents)} intents, {len(faq.automaton.patterns)} patterns")
+    return faq
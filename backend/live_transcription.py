@@ -0,0 +1,200 @@
+"""Incremental transcription of a streamed microphone signal"""
+import os
+import time
+import asyncio
+import logging
+
+import numpy as np
+
+from backend.vad import SpeechSegmenter
+from backend.transcription import SAMPLE_RATE, TranscriptionError, DecoderUnavailableError
+from backend.scheduler import AdmissionError
+
+logger = logging.getLogger(__name__)
+
+# Как часто перераспознавать растущий сегмент ради промежуточного текста
+LIVE_PARTIAL_INTERVAL = float(os.environ.get("LIVE_PARTIAL_INTERVAL", 0.7))
+LIVE_MAX_SESSION_S = float(os.environ.get("LIVE_MAX_SESSION_S", 300))
+
+# pcm16 - сырые отсчеты; webm/ogg (Opus из MediaRecorder) декодируются потоковым ffmpeg
+STREAM_ENCODINGS = ("pcm16", "webm", "ogg")
+
+
+class FFmpegStreamDecoder:
+    """Long-lived ffmpeg process: container chunks in, mono 16 kHz PCM16 out"""
+
+    def __init__(self, on_samples):
+        self.on_samples = on_samples
+        self._process = None
+        self._reader = None
+
+    async def start(self):
+        try:
+            self._process = await asyncio.create_subprocess_exec(
+                "ffmpeg", "-nostdin", "-loglevel", "error", "-i", "pipe:0",
+                "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1",
+                stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+        except FileNotFoundError:
+            raise DecoderUnavailableError("ffmpeg is not installed")
+        self._reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        leftover = b""
+        try:
+            while True:
+                chunk = await self._process.stdout.read(8192)
+                if not chunk:
+                    break
+                chunk = leftover + chunk
+                usable = len(chunk) - len(chunk) % 2
+                leftover = chunk[usable:]
+                await self.on_samples(pcm16_to_float(chunk[:usable]))
+        except Exception:
+            # Вывод больше никто не читает - ffmpeg иначе встанет на полном stdout
+            if self._process.returncode is None:
+                try:
+                    self._process.kill()
+                except ProcessLookupError:
+                    pass
+            raise
+
+    def _raise_if_stopped(self):
+        if not self._reader.done():
+            return
+        if not self._reader.cancelled() and self._reader.exception() is not None:
+            raise self._reader.exception()
+        raise TranscriptionError("Audio decoder stopped")
+
+    async def write(self, data):
+        """Send a container chunk; raise the reader's error if decoding stopped"""
+        self._raise_if_stopped()
+        self._process.stdin.write(data)
+        drain = asyncio.ensure_future(self._process.stdin.drain())
+        # drain не вернется, если читатель упал и ffmpeg перестал принимать вход
+        await asyncio.wait({drain, self._reader}, return_when=asyncio.FIRST_COMPLETED)
+        if not drain.done():
+            drain.cancel()
+            await asyncio.gather(drain, return_exceptions=True)
+            self._raise_if_stopped()
+        drain.result()
+
+    async def close(self):
+        """Flush the decoder and wait until all output is delivered"""
+        if self._process is None:
+            return
+        if not self._process.stdin.is_closing():
+            self._process.stdin.close()
+        await asyncio.gather(self._reader, return_exceptions=True)
+        await self._process.wait()
+        self._process = None
+
+
+def pcm16_to_float(data):
+    return np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0
+
+
+class LiveTranscription:
+    """One streaming connection: VAD segmentation plus partial and final decodes.
+
+    `send` is an async callable taking a JSON-able dict. Partial transcripts
+    of the segment in progress are produced at most every `partial_interval`
+    seconds of new audio, one at a time; each finished segment is decoded
+    once more and reported as final. Finals are sent in segment order and
+    partials arriving after their segment's final are dropped; `on_final`
+    runs in its own task, so a slow answer to one segment does not hold
+    back the finals of the next ones.
+    """
+
+    def __init__(self, transcriber, send, on_final=None, partial_interval=LIVE_PARTIAL_INTERVAL):
+        self.transcriber = transcriber
+        self.send = send
+        self.on_final = on_final
+        self.partial_interval = partial_interval
+        self.segmenter = SpeechSegmenter(SAMPLE_RATE)
+        self.segment_index = 0
+        self.received_samples = 0
+        self._since_partial = 0
+        self._partial_task = None
+        self._finals = []
+        self._callbacks = set()
+        self._closed_segments = set()
+
+    async def feed_pcm16(self, data):
+        await self.feed(pcm16_to_float(data))
+
+    async def feed(self, samples):
+        self.received_samples += len(samples)
+        if self.received_samples > LIVE_MAX_SESSION_S * SAMPLE_RATE:
+            raise TranscriptionError("Streaming session is too long")
+        was_in_speech = self.segmenter.in_speech
+        finished = self.segmenter.feed(samples)
+        for audio in finished:
+            self._finalize(audio)
+        # Новый сегмент мог начаться в том же куске, где закончился предыдущий
+        if self.segmenter.in_speech and (finished or not was_in_speech):
+            await self.send({"type": "speech_start", "segment": self.segment_index})
+
+        if self.segmenter.in_speech:
+            self._since_partial += len(samples)
+            if self._since_partial >= self.partial_interval * SAMPLE_RATE and self._partial_task is None:
+                self._since_partial = 0
+                self._partial_task = asyncio.create_task(self._partial(self.segment_index, self.segmenter.current()))
+
+    async def finish(self):
+        """End of stream: finalize the open segment and wait for all finals"""
+        audio = self.segmenter.flush()
+        if audio is not None:
+            self._finalize(audio)
+        await asyncio.gather(*self._finals, return_exceptions=True)
+        if self._partial_task is not None:
+            self._partial_task.cancel()
+        await asyncio.gather(*self._callbacks, return_exceptions=True)
+
+    def cancel(self):
+        """Drop pending work after the client went away"""
+        for task in (*self._finals, *self._callbacks):
+            task.cancel()
+        if self._partial_task is not None:
+            self._partial_task.cancel()
+
+    def _finalize(self, audio):
+        index = self.segment_index
+        self.segment_index += 1
+        self._since_partial = 0
+        self._closed_segments.add(index)
+        previous = self._finals[-1] if self._finals else None
+        self._finals.append(asyncio.create_task(self._final(index, audio, previous)))
+
+    async def _partial(self, index, audio):
+        try:
+            text = await self.transcriber.transcribe(audio)
+            if index not in self._closed_segments and text:
+                await self.send({"type": "partial", "segment": index, "text": text})
+        except (TranscriptionError, AdmissionError) as e:
+            logger.debug(f"Partial transcription skipped: {e}")
+        finally:
+            self._partial_task = None
+
+    async def _final(self, index, audio, previous):
+        timings = {"audio_ms": round(len(audio) / SAMPLE_RATE * 1000)}
+        started = time.perf_counter()
+        try:
+            text = await self.transcriber.transcribe(audio, timings)
+        except (TranscriptionError, AdmissionError) as e:
+            text = None
+            error = str(e)
+        timings["transcribe_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        # Распознаем сегменты параллельно, но отдаем строго по порядку
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+        if text is None:
+            await self.send({"type": "error", "segment": index, "detail": error})
+            return
+        await self.send({"type": "final", "segment": index, "text": text, "timings": timings})
+        if self.on_final is not None and text:
+            # Вне цепочки finals: следующий сегмент не ждет ответа на этот
+            task = asyncio.create_task(self.on_final(index, text))
+            self._callbacks.add(task)
+            task.add_done_callback(self._callbacks.discard)
@@ -0,0 +1,100 @@
+"""Process-wide async OpenAI client with a shared HTTP connection pool"""
+import os
+import logging
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Лимиты пула соединений к OpenAI (на один воркер uvicorn)
+LLM_MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", 100))
+LLM_MAX_KEEPALIVE = int(os.environ.get("LLM_MAX_KEEPALIVE", 20))
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", 60))
+LLM_CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", 5))
+# Другой OpenAI-совместимый сервер, например fake_openai_server.py для нагрузочных тестов
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL") or None
+
+_client = None
+_http_client = None
+
+
+def init_llm_client():
+    """Create the shared AsyncOpenAI client (called once at startup)"""
+    global _client, _http_client
+    if _client is not None:
+        return _client
+
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if not api_key:
+        logger.warning("OPENAI_API_KEY not set - LLM client not created")
+        return None
+
+    try:
+        from openai import AsyncOpenAI
+    except ImportError as e:
+        logger.warning(f"OpenAI not available: {e}")
+        return None
+
+    _http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE,
+        ),
+        timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+    )
+    _client = AsyncOpenAI(api_key=api_key, base_url=OPENAI_BASE_URL, http_client=_http_client)
+    logger.info(
+        f"LLM client ready (max_connections={LLM_MAX_CONNECTIONS}, "
+        f"keepalive={LLM_MAX_KEEPALIVE}, base_url={_client.base_url})"
+    )
+    return _client
+
+
+def get_llm_client():
+    """Return the shared client, creating it lazily if startup skipped it"""
+    if _client is None:
+        return init_llm_client()
+    return _client
+
+
+async def close_llm_client():
+    """Close the pooled connections (called on shutdown)"""
+    global _client, _http_client
+    if _client is not None:
+        await _client.close()
+    _client = None
+    _http_client = None
+
+
+class ChatCompletionStream:
+    """Async iterator over upstream text deltas.
+
+    After iteration finishes `text` holds the full answer and `usage` the
+    token usage reported in the final upstream chunk.
+    """
+
+    def __init__(self, client, **kwargs):
+        self.client = client
+        self.kwargs = kwargs
+        self.parts = []
+        self.usage = None
+
+    @property
+    def text(self):
+        return "".join(self.parts)
+
+    async def __aiter__(self):
+        stream = await self.client.chat.completions.create(
+            stream=True,
+            stream_options={"include_usage": True},
+            **self.kwargs,
+        )
+        async for chunk in stream:
+            if chunk.usage is not None:
+                self.usage = chunk.usage.model_dump()
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                self.parts.append(delta)
+                yield delta
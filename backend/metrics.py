@@ -0,0 +1,204 @@
+"""In-process metrics in the Prometheus text exposition format"""
+import time
+import bisect
+
+# Границы в секундах: от промаха в кэше до полного ответа модели
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter; one float per label combination, or read from a
+    callback at scrape time for components that keep their own counters"""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=(), callback=None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.callback = callback
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        values = self.callback() if self.callback is not None else self._values
+        for label_values, value in values.items():
+            yield self.name, _format_labels(self.labels, label_values), value
+
+
+class Gauge:
+    """Current value, either set directly or read from a callback at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), callback=None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.callback = callback
+        self._values = {}
+
+    def set(self, value, *label_values):
+        self._values[label_values] = value
+
+    def inc(self, *label_values, amount=1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+    def samples(self):
+        values = self.callback() if self.callback is not None else self._values
+        for label_values, value in values.items():
+            yield self.name, _format_labels(self.labels, label_values), value
+
+
+class Histogram:
+    """Cumulative bucket histogram; observe() is a bisect and two additions"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+
+    def observe(self, value, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            # Счетчики по корзинам + сумма + количество
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def samples(self):
+        names = self.labels + ("le",)
+        for label_values, (counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(names, label_values + (_format_value(bound),))
+                yield f"{self.name}_bucket", labels, cumulative
+            labels = _format_labels(self.labels, label_values)
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route, method and status",
+    labels=("route", "method", "status")
+))
+http_latency = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency until the response body is sent",
+    labels=("route", "method")
+))
+http_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served"
+))
+stage_latency = registry.register(Histogram(
+    "stage_duration_seconds", "Latency of individual request stages",
+    labels=("stage",)
+))
+
+# Ключи словаря timings в обработчиках -> имя стадии в метриках
+TIMING_STAGES = {
+    "cache_ms": "cache_lookup",
+    "semantic_cache_ms": "semantic_cache_lookup",
+    "embedding_ms": "embedding",
+    "retrieval_ms": "retrieval",
+    "llm_first_token_ms": "llm_ttft",
+    "llm_ms": "llm_total",
+    "audio_decode_ms": "audio_decode",
+    "transcribe_queue_ms": "transcribe_queue",
+    "transcribe_decode_ms": "transcribe_decode",
+}
+
+
+def observe_stage(stage, seconds):
+    stage_latency.observe(seconds, stage)
+
+
+def observe_timings(timings):
+    """Feed the per-request timings dict of a handler into the stage histograms"""
+    for key, stage in TIMING_STAGES.items():
+        value = timings.get(key)
+        if value is not None:
+            stage_latency.observe(value / 1000, stage)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: counts and times every HTTP request by route template.
+
+    Latency runs until the last body chunk is sent, so streaming responses
+    are measured over their whole duration.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight.dec()
+            # Шаблон маршрута, а не сырой путь, чтобы число серий было ограничено
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            http_requests.inc(path, scope["method"], str(status))
+            http_latency.observe(time.perf_counter() - started, path, scope["method"])
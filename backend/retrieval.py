@@ -0,0 +1,144 @@
+"""BM25 retrieval over the Constitution corpus"""
+import os
+import re
+import math
+import logging
+from collections import Counter
+from functools import lru_cache
+
+from backend.corpus import get_constitution
+
+logger = logging.getLogger(__name__)
+
+RETRIEVAL_TOP_K = int(os.environ.get("RETRIEVAL_TOP_K", 4))
+# Статьи ниже порога не попадают в контекст: слабое совпадение по одному
+# общему слову ("право", "суд") уводит ответ к чужой статье
+RETRIEVAL_MIN_SCORE = float(os.environ.get("RETRIEVAL_MIN_SCORE", 2.0))
+# Доля от score лучшей статьи
+RETRIEVAL_RELATIVE_MIN = float(os.environ.get("RETRIEVAL_RELATIVE_MIN", 0.6))
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"[а-яa-z0-9]+")
+
+STOPWORDS = frozenset("""
+а без более бы был была были было быть в вам вас весь во вот все всего всех вы
+где да даже для до его ее ей ему если есть еще же за и из или им их к как кто ли
+либо между мне мы на над надо не него нее нет ни них но ну о об однако он она они
+оно от по под при про с со так также такой там те тем то того тоже той только том
+ты у уже чем что чтобы эта эти это я какая какое какую какие какой каких которые который может могут
+расскажи скажи объясни пожалуйста
+""".split())
+
+# Окончания для лёгкого стемминга (от длинных к коротким)
+_SUFFIXES = sorted("""
+иями ями ами ией иях ях ах ов ев ей ий ый ой ая яя ое ее ие ые ого его ому ему
+ым им ом ем ую юю ью ья ье ия ию ии а я о е ы и у ю ь
+ость ости остью остей ение ения ению ением ении ений ениям
+ать ять ить еть ут ют ат ят ет ит ем им ешь ишь ся сь
+ного ному ным ном ных ными ная ной ную ное ные
+""".split(), key=len, reverse=True)
+
+
+@lru_cache(maxsize=50000)
+def stem(word):
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def tokenize(text):
+    """Lowercase, fold ё, drop stopwords and stem Russian words"""
+    text = text.lower().replace("ё", "е")
+    return [stem(t) for t in _TOKEN_RE.findall(text) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """Inverted index with Okapi BM25 scoring"""
+
+    def __init__(self, documents, k1=BM25_K1, b=BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.keys = []
+        self.doc_lengths = []
+        self.postings = {}
+        for key, text in documents:
+            tokens = tokenize(text)
+            doc_id = len(self.keys)
+            self.keys.append(key)
+            self.doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                self.postings.setdefault(term, []).append((doc_id, tf))
+        n = len(self.keys)
+        self.avgdl = (sum(self.doc_lengths) / n) if n else 0.0
+        self.idf = {
+            term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    def search(self, query, k=RETRIEVAL_TOP_K, min_score=RETRIEVAL_MIN_SCORE,
+               relative_min=RETRIEVAL_RELATIVE_MIN):
+        """Return up to k (key, score) pairs, best first.
+
+        Pairs scoring below `min_score` or below `relative_min` times the
+        best score are dropped, so an off-topic query returns nothing.
+        """
+        scores = {}
+        k1, b, avgdl = self.k1, self.b, self.avgdl or 1.0
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf[term]
+            for doc_id, tf in postings:
+                norm = k1 * (1 - b + b * self.doc_lengths[doc_id] / avgdl)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        if not best:
+            return []
+        floor = max(min_score, best[0][1] * relative_min)
+        return [(self.keys[doc_id], score) for doc_id, score in best if score >= floor]
+
+
+class ArticleRetriever:
+    """BM25 search returning Article objects"""
+
+    def __init__(self, constitution):
+        self.constitution = constitution
+        self.index = BM25Index(
+            (number, _article_document(article))
+            for number, article in constitution.articles.items()
+        )
+
+    def search(self, query, k=RETRIEVAL_TOP_K, **cutoff):
+        return [
+            (self.constitution.articles[number], score)
+            for number, score in self.index.search(query, k, **cutoff)
+        ]
+
+
+def _article_document(article):
+    parts = [article.section_title]
+    if article.chapter_title:
+        parts.append(article.chapter_title)
+    parts.extend(article.paragraphs)
+    return "\n".join(parts)
+
+
+@lru_cache(maxsize=1)
+def get_retriever() -> ArticleRetriever:
+    retriever = ArticleRetriever(get_constitution())
+    logger.info(f"BM25 index built: {len(retriever.index.postings)} terms")
+    return retriever
+
+
+def format_context(results):
+    """Render retrieved articles for the system prompt"""
+    if not results:
+        return ""
+    blocks = [f"Статья {article.number}. {article.text}" for article, _ in results]
+    return (
+        "Релевантные статьи Конституции (опирайся на них и указывай их номера):\n\n"
+        + "\n\n".join(blocks)
+    )
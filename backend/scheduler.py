@@ -0,0 +1,155 @@
+"""Admission control and priority scheduling for upstream LLM calls"""
+import os
+import time
+import heapq
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", 16))
+LLM_MAX_QUEUE = int(os.environ.get("LLM_MAX_QUEUE", 64))
+# Фоновые ожидающие (сводки, пополнение пула) считаются отдельно и не занимают LLM_MAX_QUEUE
+LLM_MAX_BACKGROUND_QUEUE = int(os.environ.get("LLM_MAX_BACKGROUND_QUEUE", 8))
+LLM_QUEUE_TIMEOUT = float(os.environ.get("LLM_QUEUE_TIMEOUT", 10))
+LLM_VOICE_QUEUE_TIMEOUT = float(os.environ.get("LLM_VOICE_QUEUE_TIMEOUT", 5))
+LLM_BACKGROUND_QUEUE_TIMEOUT = float(os.environ.get("LLM_BACKGROUND_QUEUE_TIMEOUT", 30))
+
+# Меньше значение - выше приоритет
+PRIORITY_VOICE = 0
+PRIORITY_CHAT = 10
+PRIORITY_BACKGROUND = 20
+
+QUEUE_TIMEOUTS = {
+    PRIORITY_VOICE: LLM_VOICE_QUEUE_TIMEOUT,
+    PRIORITY_CHAT: LLM_QUEUE_TIMEOUT,
+    PRIORITY_BACKGROUND: LLM_BACKGROUND_QUEUE_TIMEOUT,
+}
+
+
+class AdmissionError(Exception):
+    status_code = 503
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class QueueFullError(AdmissionError):
+    status_code = 429
+
+
+class QueueTimeoutError(AdmissionError):
+    status_code = 503
+
+
+class LLMScheduler:
+    """Concurrency cap with a bounded priority wait queue.
+
+    Up to `max_concurrency` upstream calls run at once; further callers wait
+    in a heap ordered by (priority, arrival). Callers are rejected at once
+    when `max_queue` are already waiting, and give up after their class
+    deadline. Background waiters have their own `max_background_queue`, so
+    queued background work never turns a chat or voice call into a 429.
+    """
+
+    def __init__(self, max_concurrency=LLM_MAX_CONCURRENCY, max_queue=LLM_MAX_QUEUE,
+                 max_background_queue=LLM_MAX_BACKGROUND_QUEUE):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_background_queue = max_background_queue
+        self.active = 0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._avg_service_time = 2.0
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    @property
+    def queued(self):
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    def _queued_in_class(self, background):
+        return sum(
+            1 for priority, _, fut in self._waiters
+            if not fut.done() and (priority >= PRIORITY_BACKGROUND) == background
+        )
+
+    def retry_after(self):
+        """Rough seconds until a queued request would be served"""
+        backlog = self.queued + 1
+        seconds = self._avg_service_time * backlog / max(self.max_concurrency, 1)
+        return max(1, int(seconds + 0.999))
+
+    async def acquire(self, priority=PRIORITY_CHAT, timeout=None):
+        if self.active < self.max_concurrency and not self.queued:
+            self.active += 1
+            self.admitted += 1
+            return
+        background = priority >= PRIORITY_BACKGROUND
+        limit = self.max_background_queue if background else self.max_queue
+        if self._queued_in_class(background) >= limit:
+            self.rejected += 1
+            raise QueueFullError("Too many requests, try again later", self.retry_after())
+
+        timeout = QUEUE_TIMEOUTS.get(priority, LLM_QUEUE_TIMEOUT) if timeout is None else timeout
+        if len(self._waiters) > 2 * self.max_queue:
+            self._waiters = [w for w in self._waiters if not w[2].done()]
+            heapq.heapify(self._waiters)
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        # Не wait_for: в 3.11 он проглатывает отмену, если слот уже выдан
+        timer = loop.call_later(timeout, self._expire, fut)
+        try:
+            await fut
+        except QueueTimeoutError:
+            self.timeouts += 1
+            raise
+        except asyncio.CancelledError:
+            # Слот мог быть выдан в момент отмены - вернуть его
+            if fut.done() and not fut.cancelled() and fut.exception() is None:
+                self.release()
+            raise
+        finally:
+            timer.cancel()
+        self.admitted += 1
+
+    def _expire(self, fut):
+        if not fut.done():
+            fut.set_exception(QueueTimeoutError("Service is busy, try again later", self.retry_after()))
+
+    def release(self, service_time=None):
+        if service_time is not None:
+            self._avg_service_time = 0.9 * self._avg_service_time + 0.1 * service_time
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                # Слот переходит следующему в очереди, active не меняется
+                fut.set_result(True)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority=PRIORITY_CHAT, timeout=None):
+        await self.acquire(priority, timeout)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def stats(self):
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "max_background_queue": self.max_background_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+        }
+
+
+llm_scheduler = LLMScheduler()
@@ -0,0 +1,211 @@
+"""Semantic answer cache: cosine search over embeddings of answered questions"""
+import os
+import re
+import time
+import zlib
+import logging
+import importlib.util
+
+from backend.cache import normalize_question, ANSWER_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+# numpy импортируется при создании кэша в прогреве, а не при импорте сервера
+NUMPY_AVAILABLE = importlib.util.find_spec("numpy") is not None
+if not NUMPY_AVAILABLE:
+    logger.warning("NumPy not available, semantic cache disabled")
+
+SEMANTIC_CACHE_ENABLED = os.environ.get("SEMANTIC_CACHE_ENABLED", "1") == "1"
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", 0.92))
+SEMANTIC_CACHE_CAPACITY = int(os.environ.get("SEMANTIC_CACHE_CAPACITY", 5000))
+# "openai" - эмбеддинги OpenAI, "hashing" - локальная детерминированная замена для офлайн-тестов
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "openai")
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "text-embedding-3-small")
+HASHING_EMBEDDING_DIM = int(os.environ.get("HASHING_EMBEDDING_DIM", 512))
+
+# Номера статей и частей: "статья 24" и "статья 25" близки по косинусу, но ответы разные
+_NUMBER_RE = re.compile(r"\d+(?:-\d+)?")
+
+
+def question_numbers(text):
+    """Numbers and article references such as 89-1 mentioned in a question"""
+    return frozenset(_NUMBER_RE.findall(text))
+
+
+def _normalize_rows(matrix):
+    import numpy as np
+
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class HashingEmbedder:
+    """Deterministic character n-gram embedding that needs no network.
+
+    Character 3- and 4-grams of the normalized text are hashed into a
+    fixed number of signed buckets, so paraphrases that share most of their
+    wording end up close in cosine space.
+    """
+
+    # Считается локально, слот планировщика не нужен
+    remote = False
+
+    def __init__(self, dim=HASHING_EMBEDDING_DIM, ngram_sizes=(3, 4)):
+        self.dim = dim
+        self.ngram_sizes = ngram_sizes
+
+    def embed(self, texts):
+        import numpy as np
+
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            padded = f" {normalize_question(text)} "
+            for n in self.ngram_sizes:
+                for i in range(len(padded) - n + 1):
+                    h = zlib.crc32(padded[i:i + n].encode("utf-8"))
+                    matrix[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        return _normalize_rows(matrix)
+
+    async def aembed(self, texts):
+        return self.embed(texts)
+
+
+class OpenAIEmbedder:
+    """Embeddings from the OpenAI API using the shared async client"""
+
+    remote = True
+
+    def __init__(self, client, model=EMBEDDING_MODEL):
+        self.client = client
+        self.model = model
+
+    async def aembed(self, texts):
+        import numpy as np
+
+        response = await self.client.embeddings.create(model=self.model, input=list(texts))
+        matrix = np.array([item.embedding for item in response.data], dtype=np.float32)
+        return _normalize_rows(matrix)
+
+
+class SemanticCache:
+    """Fixed-capacity matrix of unit question vectors with their answers.
+
+    Search is one matrix product against all stored rows; when full the
+    least recently used row is overwritten. Rows expire after `ttl` like
+    AnswerCache entries, and a row only matches a question that mentions
+    the same numbers (article references).
+    """
+
+    def __init__(self, capacity=SEMANTIC_CACHE_CAPACITY, threshold=SEMANTIC_CACHE_THRESHOLD,
+                 ttl=ANSWER_CACHE_TTL):
+        import numpy as np
+
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl = ttl
+        self.vectors = None  # (capacity, dim), создается при первом добавлении
+        self.answers = [None] * capacity
+        self.numbers = [frozenset()] * capacity
+        self.last_used = np.zeros(capacity, dtype=np.float64)
+        self.expires_at = np.zeros(capacity, dtype=np.float64)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.number_mismatches = 0
+
+    def search_batch(self, queries, threshold=None, numbers=None):
+        """Return (answer, score, seconds left to live) or None for each row of `queries`.
+
+        `numbers` holds question_numbers() of each query; rows stored with
+        different numbers are skipped even when their score is higher.
+        """
+        import numpy as np
+
+        threshold = self.threshold if threshold is None else threshold
+        if self.size == 0 or self.vectors is None or queries.shape[1] != self.vectors.shape[1]:
+            self.misses += len(queries)
+            return [None] * len(queries)
+        scores = queries @ self.vectors[:self.size].T
+        now = time.monotonic()
+        expired = self.expires_at[:self.size] <= now
+        if expired.any():
+            # Просроченные строки вытесняются первыми
+            self.expirations += int(np.count_nonzero(self.last_used[:self.size][expired]))
+            self.last_used[:self.size][expired] = 0
+            scores[:, expired] = -np.inf
+        results = []
+        for i, row_scores in enumerate(scores):
+            candidates = np.flatnonzero(row_scores >= threshold)
+            hit = None
+            for row in candidates[np.argsort(-row_scores[candidates])]:
+                if numbers is not None and self.numbers[row] != numbers[i]:
+                    self.number_mismatches += 1
+                    continue
+                hit = row
+                break
+            if hit is None:
+                self.misses += 1
+                results.append(None)
+                continue
+            self.last_used[hit] = now
+            self.hits += 1
+            results.append((self.answers[hit], float(row_scores[hit]), float(self.expires_at[hit] - now)))
+        return results
+
+    def search(self, vector, threshold=None, numbers=None):
+        return self.search_batch(
+            vector.reshape(1, -1), threshold, None if numbers is None else [numbers]
+        )[0]
+
+    def add(self, vector, answer, numbers=frozenset()):
+        import numpy as np
+
+        if self.vectors is None or self.vectors.shape[1] != vector.shape[0]:
+            self.vectors = np.zeros((self.capacity, vector.shape[0]), dtype=np.float32)
+            self.answers = [None] * self.capacity
+            self.numbers = [frozenset()] * self.capacity
+            self.size = 0
+        if self.size < self.capacity:
+            row = self.size
+            self.size += 1
+        else:
+            row = int(self.last_used.argmin())
+            self.evictions += 1
+        now = time.monotonic()
+        self.vectors[row] = vector
+        self.answers[row] = answer
+        self.numbers[row] = numbers
+        self.last_used[row] = now
+        self.expires_at[row] = now + self.ttl
+
+    def clear(self):
+        count = self.size
+        self.answers = [None] * self.capacity
+        self.numbers = [frozenset()] * self.capacity
+        self.last_used[:] = 0
+        self.expires_at[:] = 0
+        self.size = 0
+        return count
+
+    def stats(self):
+        return {
+            "entries": self.size,
+            "capacity": self.capacity,
+            "threshold": self.threshold,
+            "ttl_seconds": self.ttl,
+            "bytes": int(self.vectors.nbytes) if self.vectors is not None else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "number_mismatches": self.number_mismatches,
+        }
+
+
+def create_embedder(client):
+    if EMBEDDING_BACKEND == "hashing" or client is None:
+        return HashingEmbedder()
+    return OpenAIEmbedder(client)
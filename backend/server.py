@@ -1,20 +1,61 @@
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, APIRouter, Request
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, APIRouter, Request, Query, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, JSONResponse, FileResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse, Response
 from pydantic import BaseModel, Field
 from typing import List, Optional
-# MongoDB imports - only ObjectId needed for PyObjectId
-from bson import ObjectId
 import os
-from dotenv import load_dotenv
 import uuid
 from datetime import datetime, timezone
 import json
-import tempfile
+import time
+import asyncio
+import hashlib
 import logging
+import importlib.util
 
-load_dotenv()
+def _env_file_present():
+    """Same lookup as load_dotenv(): .env next to this file or in a parent directory"""
+    directory = os.path.dirname(os.path.abspath(__file__))
+    while True:
+        if os.path.isfile(os.path.join(directory, ".env")):
+            return True
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return False
+        directory = parent
+
+# На Railway переменные приходят из окружения - python-dotenv нужен только локально
+if _env_file_present():
+    from dotenv import load_dotenv
+    load_dotenv()
+
+from backend.llm import init_llm_client, get_llm_client, close_llm_client, ChatCompletionStream
+from backend.streaming import sse_event, coalesce_deltas, SSE_HEADERS
+from backend.corpus import get_constitution, parse_article_request
+from backend.retrieval import get_retriever, format_context
+from backend.faq import get_faq, FAQ_ENABLED
+from backend.topic import get_topic_classifier, OFFTOPIC_ENABLED, OFFTOPIC_REFUSAL
+from backend.cache import answer_cache, cache_key
+from backend.singleflight import SingleFlight, StreamSingleFlight
+from backend.scheduler import llm_scheduler, AdmissionError, PRIORITY_CHAT, PRIORITY_VOICE, PRIORITY_BACKGROUND
+from backend.semantic_cache import (
+    SemanticCache, create_embedder, question_numbers, NUMPY_AVAILABLE, SEMANTIC_CACHE_ENABLED
+)
+from backend.storage import MongoMessageStore, SQLiteMessageStore
+from backend.write_behind import WriteBehindQueue
+from backend.sessions import session_store
+from backend.summarizer import SessionSummarizer
+from backend.voice_pool import RealtimeSessionPool
+from backend.transcription import (
+    WhisperTranscriber, TranscriptionError, DecoderUnavailableError,
+    WHISPER_AVAILABLE, TRANSCRIBE_ENABLED, FFMPEG_AVAILABLE
+)
+from backend.audio_ingest import (
+    AudioBufferPool, BodyTooLargeError, multipart_boundary, find_multipart_file, decode_upload
+)
+from backend.static_assets import get_static_assets, asset_response_parts, REVALIDATE_CACHE
+from backend.metrics import registry, Counter, Gauge, MetricsMiddleware, observe_stage, observe_timings
+from backend.tokens import count_tokens, get_encoding, CONTEXT_TOKEN_BUDGET, MESSAGE_TOKEN_OVERHEAD
 
 # Logging
 logging.basicConfig(level=logging.INFO)
@@ -22,17 +63,37 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
-# Mount static files
-app.mount("/static", StaticFiles(directory="docs/static"), name="static")
-
-# MongoDB setup - disabled for Railway deployment
-# MONGO_URL = os.environ.get("MONGO_URL")
-# if MONGO_URL:
-#     client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URL)
-#     db = client[os.environ.get("DB_NAME", "belarus_constitution")]
-# else:
-client = None
+# MongoDB setup - optional, Railway deployment runs without MONGO_URL
+MONGO_URL = os.environ.get("MONGO_URL")
+mongo_client = None
 db = None
+if MONGO_URL:
+    try:
+        import motor.motor_asyncio
+        mongo_client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URL, tz_aware=True)
+        db = mongo_client[os.environ.get("DB_NAME", "belarus_constitution")]
+    except ImportError as e:
+        logger.warning(f"Motor not available, MongoDB disabled: {e}")
+
+# Без MongoDB история хранится во встроенной SQLite (WAL); SQLITE_PATH="" отключает
+SQLITE_PATH = os.environ.get("SQLITE_PATH", "data/messages.db")
+
+# Сообщения пишутся в БД пачками в фоне, вне пути запроса
+if db is not None:
+    message_store = MongoMessageStore(db)
+elif SQLITE_PATH:
+    message_store = SQLiteMessageStore(SQLITE_PATH)
+else:
+    message_store = None
+
+async def store_messages(docs):
+    started = time.perf_counter()
+    try:
+        await message_store.insert_many(docs)
+    finally:
+        observe_stage("persistence", time.perf_counter() - started)
+
+message_writer = WriteBehindQueue(store_messages) if message_store is not None else None
 
 # CORS - разрешаем все origins для Railway
 app.add_middleware(
@@ -42,22 +103,18 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Счетчики и задержки по маршрутам; снаружи CORS, чтобы учитывать все ответы
+app.add_middleware(MetricsMiddleware)
 
-# Custom PyObjectId for MongoDB ObjectId handling
-class PyObjectId(ObjectId):
-    @classmethod
-    def __get_validators__(cls):
-        yield cls.validate
-
-    @classmethod
-    def validate(cls, v):
-        if not ObjectId.is_valid(v):
-            raise ValueError("Invalid objectid")
-        return ObjectId(v)
-
-    @classmethod
-    def __modify_schema__(cls, field_schema):
-        field_schema.update(type="string")
+registry.register(Gauge(
+    "llm_scheduler_requests", "Upstream LLM calls running and waiting for a slot",
+    labels=("state",),
+    callback=lambda: {("active",): llm_scheduler.active, ("queued",): llm_scheduler.queued}
+))
+registry.register(Gauge(
+    "write_behind_queue_depth", "Messages waiting to be written to the message store",
+    callback=lambda: {(): message_writer.depth() if message_writer is not None else 0}
+))
 
 # Pydantic models
 class ChatMessage(BaseModel):
@@ -87,20 +144,251 @@ SYSTEM_PROMPT = """Ты - Алеся, эксперт по Конституции
 
 Отвечай на русском языке, будь дружелюбной и профессиональной."""
 
-# OpenAI integration
-try:
-    from openai import OpenAI
-    INTEGRATION_AVAILABLE = True
-    VOICE_MODE_AVAILABLE = True
+# Модель можно сменить на более быструю/дешевую - ответы опираются на найденные статьи
+CHAT_MODEL = os.environ.get("OPENAI_CHAT_MODEL", "gpt-4")
+
+# Версия промпта входит в ключ кэша: при смене промпта старые ответы не используются
+PROMPT_VERSION = os.environ.get("PROMPT_VERSION") or hashlib.sha1(SYSTEM_PROMPT.encode()).hexdigest()[:12]
+
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+# Семантический кэш: перефразированные вопросы получают уже готовый ответ
+# Создается в прогреве вместе с эмбеддером: numpy не грузится при импорте сервера
+semantic_cache = None
+embedder = None
+
+# Одинаковые одновременные вопросы делят один запрос к OpenAI
+chat_flights = SingleFlight()
+# Одинаковые вопросы до входа в chat_flights делят один запрос эмбеддинга
+embedding_flights = SingleFlight()
+stream_flights = StreamSingleFlight()
+summarizer = SessionSummarizer(session_store, get_llm_client)
+
+REALTIME_MODEL = "gpt-4o-realtime-preview-2024-12-17"
+REALTIME_VOICE = "shimmer"
+REALTIME_INSTRUCTIONS = "Ты консультант по Конституции Республики Беларусь. Отвечай только по Конституции 2022 года, всегда указывай номер статьи. Если вопрос не относится к Конституции — вежливо отказывай."
+
+async def create_realtime_session(priority=PRIORITY_VOICE):
+    """Create an ephemeral realtime session and return it as a response dict"""
+    client = get_llm_client()
+    if client is None:
+        raise RuntimeError("OpenAI integration not available")
+    async with llm_scheduler.slot(priority):
+        session = await client.beta.realtime.sessions.create(
+            model=REALTIME_MODEL,
+            voice=REALTIME_VOICE,
+            instructions=REALTIME_INSTRUCTIONS
+        )
+    return {
+        "session_id": getattr(session, "id", None),
+        "model": REALTIME_MODEL,
+        "voice": REALTIME_VOICE,
+        "client_secret": {
+            "value": session.client_secret.value,
+            "expires_at": session.client_secret.expires_at
+        }
+    }
+
+# Локальный Whisper в отдельных процессах; без пакета whisper /api/transcribe отвечает 503
+transcriber = WhisperTranscriber() if WHISPER_AVAILABLE and TRANSCRIBE_ENABLED else None
+# Загрузки читаются в переиспользуемые буферы ограниченного размера, без временных файлов
+audio_buffers = AudioBufferPool()
+
+# Готовые голосовые сессии: нажатие на микрофон не ждет OpenAI
+voice_pool = RealtimeSessionPool(lambda: create_realtime_session(PRIORITY_BACKGROUND))
+registry.register(Gauge(
+    "voice_pool_sessions", "Pre-created realtime sessions ready to hand out",
+    callback=lambda: {(): voice_pool.stats()["ready"]}
+))
+registry.register(Counter(
+    "voice_pool_requests_total", "Voice session requests served from the pool or created on demand",
+    labels=("result",),
+    callback=lambda: {("hit",): voice_pool.hits, ("miss",): voice_pool.misses}
+))
+
+# OpenAI integration: пакет импортируется при создании клиента, здесь только проверка наличия
+INTEGRATION_AVAILABLE = importlib.util.find_spec("openai") is not None
+VOICE_MODE_AVAILABLE = INTEGRATION_AVAILABLE
+if INTEGRATION_AVAILABLE:
     logger.info("OpenAI integration available")
-except ImportError as e:
-    INTEGRATION_AVAILABLE = False
-    VOICE_MODE_AVAILABLE = False
-    logger.warning(f"OpenAI not available: {e}")
+else:
+    logger.warning("OpenAI not available: package 'openai' is not installed")
+
+# Прогрев идет в фоне после старта: порт открыт сразу, /ready отвечает 200 по окончании
+startup_phases = {}
+failed_phases = {}
+warmup_task = None
+warmup_finished_at = None
+# Индексы, токенизатор и клиент OpenAI готовы; Whisper может еще загружаться
+serving_ready = asyncio.Event()
+SERVER_LOADED_AT = time.time()
+# Сколько запрос, пришедший во время прогрева, ждет его окончания до ответа 503
+WARMUP_WAIT_TIMEOUT = float(os.environ.get("WARMUP_WAIT_TIMEOUT", 15))
+
+async def timed_phase(name, func, *args, thread=False):
+    """Run one warm-up step and record its duration in startup_phases.
+
+    A failing step is logged and recorded in failed_phases and returns
+    None, so the other steps still run and warm-up always finishes.
+    """
+    started = time.perf_counter()
+    try:
+        if thread:
+            return await asyncio.to_thread(func, *args)
+        result = func(*args)
+        return await result if asyncio.iscoroutine(result) else result
+    except Exception as e:
+        logger.exception(f"Warm-up phase '{name}' failed")
+        failed_phases[name] = f"{type(e).__name__}: {e}"
+        return None
+    finally:
+        startup_phases[name] = round((time.perf_counter() - started) * 1000, 1)
+
+async def wait_for_warmup(timeout=WARMUP_WAIT_TIMEOUT):
+    """True once the phases requests depend on are done, waiting for them
+    at most `timeout` seconds. Whisper workers are not waited for."""
+    if warmup_task is None or warmup_task.done() or serving_ready.is_set():
+        return True
+    try:
+        await asyncio.wait_for(serving_ready.wait(), timeout)
+    except asyncio.TimeoutError:
+        return False
+    return True
+
+async def require_warm():
+    """Hold requests until warm-up is done: otherwise the first ones would
+    load the tokenizer, corpus and assets synchronously on the event loop"""
+    if not await wait_for_warmup():
+        raise HTTPException(
+            status_code=503,
+            detail="Service is warming up, try again later",
+            headers={"Retry-After": "5"}
+        )
+
+async def warm_up():
+    global warmup_finished_at
+    started = time.perf_counter()
+
+    async def llm():
+        # Один общий async-клиент с пулом соединений на весь процесс
+        global embedder, semantic_cache
+        if not INTEGRATION_AVAILABLE:
+            return
+        await timed_phase("import_openai", importlib.import_module, "openai", thread=True)
+        llm_client = await timed_phase("llm_client", init_llm_client)
+        if llm_client is not None and VOICE_MODE_AVAILABLE:
+            voice_pool.start()
+        if NUMPY_AVAILABLE and SEMANTIC_CACHE_ENABLED:
+            semantic_cache = await timed_phase("semantic_cache", SemanticCache, thread=True)
+        if semantic_cache is not None:
+            embedder = create_embedder(llm_client)
 
-@app.get("/")
-async def root():
-    return FileResponse("docs/index.html")
+    async def indexes():
+        # Индекс статей Конституции и статика фронтенда загружаются в память один раз
+        await timed_phase("static_assets", get_static_assets, thread=True)
+        await timed_phase("corpus", get_constitution, thread=True)
+        await timed_phase("retriever", get_retriever, thread=True)
+        if FAQ_ENABLED:
+            await timed_phase("faq", get_faq, thread=True)
+        if OFFTOPIC_ENABLED:
+            await timed_phase("topic_classifier", get_topic_classifier, thread=True)
+
+    async def whisper():
+        if transcriber is None:
+            return
+        await timed_phase("whisper", transcriber.start)
+        if "whisper" in failed_phases:
+            logger.error("Whisper workers failed to start, transcription disabled")
+            await transcriber.stop()
+
+    def record_failures(groups, results):
+        for name, result in zip(groups, results):
+            # Шаги вне timed_phase (запуск пула, эмбеддер) тоже не должны молча обрывать прогрев
+            if isinstance(result, Exception):
+                logger.error(f"Warm-up group '{name}' failed", exc_info=result)
+                failed_phases[name] = f"{type(result).__name__}: {result}"
+
+    async def serving():
+        # tiktoken скачивает словарь при первом использовании - делаем это до запросов
+        groups = {
+            "llm": llm(),
+            "indexes": indexes(),
+            "tokenizer": timed_phase("tokenizer", get_encoding, CHAT_MODEL, thread=True),
+        }
+        record_failures(groups, await asyncio.gather(*groups.values(), return_exceptions=True))
+        startup_phases["serving_ready"] = round((time.perf_counter() - started) * 1000, 1)
+        # Запросы дальше не ждут: Whisper нужен только распознаванию
+        serving_ready.set()
+
+    groups = {"serving": serving(), "whisper": whisper()}
+    record_failures(groups, await asyncio.gather(*groups.values(), return_exceptions=True))
+    startup_phases["warmup_total"] = round((time.perf_counter() - started) * 1000, 1)
+    warmup_finished_at = time.time()
+    if failed_phases:
+        logger.warning(f"Warm-up finished with failed phases: {failed_phases}")
+    logger.info(
+        f"Warm-up finished {round(warmup_finished_at - SERVER_LOADED_AT, 2)} s after import: {startup_phases}"
+    )
+
+@app.on_event("startup")
+async def startup():
+    global warmup_task
+    started = time.perf_counter()
+    if message_store is not None:
+        await message_store.ensure_indexes()
+    if message_writer is not None:
+        message_writer.start()
+    startup_phases["storage"] = round((time.perf_counter() - started) * 1000, 1)
+    warmup_task = asyncio.create_task(warm_up())
+
+@app.on_event("shutdown")
+async def shutdown():
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+        await asyncio.gather(warmup_task, return_exceptions=True)
+    await summarizer.stop()
+    await voice_pool.stop()
+    if transcriber is not None:
+        await transcriber.stop()
+    if message_writer is not None:
+        await message_writer.stop()
+    if message_store is not None:
+        await message_store.close()
+    await close_llm_client()
+
+def require_llm_client():
+    """Return the shared LLM client or fail with the same errors as before"""
+    if not os.environ.get("OPENAI_API_KEY"):
+        raise HTTPException(status_code=500, detail="OpenAI API key not configured")
+    if not INTEGRATION_AVAILABLE:
+        raise HTTPException(status_code=500, detail="OpenAI integration not available")
+    client = get_llm_client()
+    if client is None:
+        raise HTTPException(status_code=500, detail="OpenAI integration not available")
+    return client
+
+@app.get("/", dependencies=[Depends(require_warm)])
+async def root(request: Request):
+    index = get_static_assets().index
+    if index is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return static_response(request, index, REVALIDATE_CACHE)
+
+@app.api_route("/static/{path:path}", methods=["GET", "HEAD"], dependencies=[Depends(require_warm)])
+async def static_file(path: str, request: Request):
+    """Frontend assets from memory; hashed paths are immutable"""
+    asset, cache_control = get_static_assets().get(path)
+    if asset is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return static_response(request, asset, cache_control)
+
+def static_response(request, asset, cache_control):
+    status, headers, body = asset_response_parts(
+        asset, cache_control,
+        request.headers.get("accept-encoding"), request.headers.get("if-none-match")
+    )
+    media_type = asset.content_type if status == 200 else None
+    return Response(content=body, status_code=status, headers=headers, media_type=media_type)
 
 @app.get("/health")
 async def health():
@@ -110,169 +398,662 @@ async def health():
 async def api_health():
     return {"status": "ok"}
 
+@app.get("/ready")
+async def ready():
+    """Readiness: 200 once warm-up is done, 503 while indexes and workers load.
+
+    Failed phases are listed with status "degraded": the server still
+    serves, and lazy loaders retry the failed step on first use.
+    """
+    if warmup_finished_at is None:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "warming_up", "phases": startup_phases, "failed": failed_phases}
+        )
+    return {
+        "status": "degraded" if failed_phases else "ready",
+        "warmup_s": round(warmup_finished_at - SERVER_LOADED_AT, 2),
+        "phases": startup_phases,
+        "failed": failed_phases
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of the in-process counters"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/api/capabilities")
 async def get_capabilities():
     """Get available capabilities"""
     return {
         "chat": INTEGRATION_AVAILABLE,
         "voice_mode": VOICE_MODE_AVAILABLE,
-        "mongodb": db is not None
+        "mongodb": db is not None,
+        "history": message_store is not None,
+        # Браузер пишет webm/ogg - без ffmpeg его записи не распознать
+        "transcription": transcriber is not None and transcriber.decodes_compressed,
+        "live_transcription": transcriber is not None and transcriber.decodes_compressed,
+        # WAV 16 кГц и сырой PCM16 распознаются и без ffmpeg
+        "transcription_pcm": transcriber is not None and transcriber.ready
+    }
+
+@app.get("/api/articles/{number}", dependencies=[Depends(require_warm)])
+async def get_article(number: str):
+    """Get a single article of the Constitution from the local corpus"""
+    constitution = get_constitution()
+    article = constitution.get(number)
+    if article is None:
+        raise HTTPException(status_code=404, detail=f"Article {number} not found")
+    return {**article.to_dict(), "version": constitution.version, "verified": constitution.verified}
+
+def answer_from_corpus(message):
+    """Answer a pure article-number request from the index, or return None"""
+    number = parse_article_request(message)
+    if number is None:
+        return None
+    constitution = get_constitution()
+    article = constitution.get(number)
+    if article is None:
+        return None
+    return constitution.format_article(article)
+
+def answer_from_faq(message, timings):
+    """Canned answer for greetings and top FAQ intents, or None"""
+    if not FAQ_ENABLED:
+        return None
+    intent = get_faq().match(message)
+    if intent is None:
+        return None
+    timings["faq_intent"] = intent["id"]
+    return intent["answer"]
+
+def refuse_off_topic(message, timings):
+    """Canonical refusal for confidently off-topic questions, or None"""
+    if not OFFTOPIC_ENABLED:
+        return None
+    off_topic, score = get_topic_classifier().is_off_topic(message)
+    timings["offtopic_score"] = round(score, 4)
+    if not off_topic:
+        return None
+    logger.info(f"Off-topic refusal (score={score:.4f}): {message[:100]!r}")
+    return OFFTOPIC_REFUSAL
+
+def overload_error(e):
+    """HTTP error for admission rejections and upstream rate limits"""
+    if isinstance(e, AdmissionError):
+        return HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    if getattr(e, "status_code", None) == 429:
+        retry_after = "5"
+        response = getattr(e, "response", None)
+        if response is not None:
+            retry_after = response.headers.get("retry-after", retry_after)
+        return HTTPException(
+            status_code=429,
+            detail="Upstream rate limit, try again later",
+            headers={"Retry-After": retry_after}
+        )
+    return None
+
+def require_admin(request: Request):
+    """Admin endpoints are enabled only when ADMIN_TOKEN is configured"""
+    if not ADMIN_TOKEN or request.headers.get("X-Admin-Token") != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+@app.get("/api/admin/cache", dependencies=[Depends(require_admin)])
+async def get_cache_stats():
+    """Answer cache statistics"""
+    return {
+        **answer_cache.stats(),
+        "semantic": semantic_cache.stats() if semantic_cache is not None else None
     }
 
+@app.delete("/api/admin/cache", dependencies=[Depends(require_admin)])
+async def purge_cache():
+    """Drop every cached answer"""
+    purged = answer_cache.clear()
+    if semantic_cache is not None:
+        purged += semantic_cache.clear()
+    logger.info(f"Answer cache purged: {purged} entries")
+    return {"purged": purged}
+
+def answer_cache_key(message):
+    return cache_key(message, CHAT_MODEL, f"{PROMPT_VERSION}-{get_constitution().version}")
+
+def lookup_cached_answer(key, timings):
+    started = time.perf_counter()
+    answer = answer_cache.get(key)
+    timings["cache_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    timings["cache_hit"] = answer is not None
+    return answer
+
+async def embed_question(message, key):
+    """Question vector; one upstream call per key, under admission control"""
+    async def embed():
+        if not embedder.remote:
+            return (await embedder.aembed([message]))[0]
+        async with llm_scheduler.slot(PRIORITY_CHAT):
+            return (await embedder.aembed([message]))[0]
+
+    vector, _ = await embedding_flights.do(key, embed)
+    return vector
+
+async def lookup_semantic_answer(message, key, timings):
+    """Return (answer or None, seconds the answer has left to live, question vector or None)"""
+    if semantic_cache is None or embedder is None:
+        return None, None, None
+    try:
+        started = time.perf_counter()
+        vector = await embed_question(message, key)
+        timings["embedding_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        started = time.perf_counter()
+        hit = semantic_cache.search(vector, numbers=question_numbers(message))
+        timings["semantic_cache_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    except AdmissionError as e:
+        # Нет слота под эмбеддинг - идем мимо семантического кэша
+        logger.warning(f"Semantic cache skipped: {e}")
+        return None, None, None
+    except Exception as e:
+        logger.warning(f"Semantic cache lookup failed: {e}")
+        return None, None, None
+    timings["semantic_cache_hit"] = hit is not None
+    if hit is None:
+        return None, None, vector
+    answer, score, ttl = hit
+    timings["semantic_score"] = round(score, 4)
+    return answer, ttl, vector
+
+async def find_cached_answer(message, key, timings):
+    """Exact-match cache first, then the semantic cache"""
+    answer = lookup_cached_answer(key, timings)
+    if answer is not None:
+        return answer, None
+    answer, ttl, vector = await lookup_semantic_answer(message, key, timings)
+    if answer is not None:
+        # Копия живет не дольше исходной строки, иначе устаревший ответ не истечет
+        answer_cache.set(key, answer, ttl=ttl)
+    return answer, vector
+
+def remember_answer(key, vector, answer, message):
+    answer_cache.set(key, answer)
+    if vector is not None and semantic_cache is not None:
+        semantic_cache.add(vector, answer, question_numbers(message))
+
+def context_turns(session_id, timings=None, budget=CONTEXT_TOKEN_BUDGET):
+    """Return (summary, turns): the rolling summary and the most recent prior
+    turns (oldest first) that fit into the token budget after it"""
+    session = session_store.get(session_id)
+    if session is None:
+        return None, []
+    summary = session.summary
+    turns = []
+    used = session.summary_tokens + MESSAGE_TOKEN_OVERHEAD if summary else 0
+    # Токены посчитаны при сохранении сообщения, здесь только суммирование
+    for record in reversed(session.messages):
+        tokens = record.tokens if record.tokens is not None else count_tokens(record.content, CHAT_MODEL)
+        cost = tokens + MESSAGE_TOKEN_OVERHEAD
+        if used + cost > budget:
+            break
+        turns.append(record)
+        used += cost
+    turns.reverse()
+    if timings is not None:
+        timings["history_turns"] = len(turns)
+        timings["history_tokens"] = used
+        timings["history_summary"] = summary is not None
+    return summary, turns
+
+def build_messages(message, timings, history=(), summary=None):
+    """System prompt with the top-k retrieved articles, the conversation
+    summary, prior turns and the user message"""
+    started = time.perf_counter()
+    results = get_retriever().search(message)
+    timings["retrieval_ms"] = round((time.perf_counter() - started) * 1000, 3)
+
+    system_prompt = SYSTEM_PROMPT
+    context = format_context(results)
+    if context:
+        system_prompt = f"{SYSTEM_PROMPT}\n\n{context}"
+    messages = [{"role": "system", "content": system_prompt}]
+    if summary:
+        messages.append({"role": "system", "content": f"Краткое содержание предыдущей беседы:\n{summary}"})
+    return (
+        messages
+        + [{"role": record.role, "content": record.content} for record in history]
+        + [{"role": "user", "content": message}]
+    )
+
+def log_usage(usage, timings):
+    if usage:
+        logger.info(
+            f"Chat tokens: prompt={usage.get('prompt_tokens')} "
+            f"completion={usage.get('completion_tokens')} "
+            f"history_turns={timings.get('history_turns', 0)}"
+        )
+
 def prepare_for_mongo(data):
     """Prepare data for MongoDB storage"""
     if "_id" in data:
+        from bson import ObjectId
         data["_id"] = ObjectId(data["_id"])
     return data
 
-@app.post("/api/chat", response_model=ChatResponse)
+async def persist_message(session_id, role, content):
+    """Keep the message in session memory and queue it for write-behind storage"""
+    session_store.append(session_id, role, content, tokens=count_tokens(content, CHAT_MODEL))
+    if role == "assistant":
+        # Старые реплики сворачиваются в резюме в фоне, ответ этого не ждет
+        summarizer.maybe_schedule(session_id)
+    if message_writer is None:
+        # No message store - just log the message
+        logger.info(f"{role.capitalize()} message: {content}")
+        return
+    message = ChatMessage(
+        id=str(uuid.uuid4()),
+        session_id=session_id,
+        content=content,
+        role=role,
+        timestamp=datetime.now(timezone.utc)
+    )
+    await message_writer.enqueue(prepare_for_mongo(message.model_dump()))
+
+@app.get("/api/history/{session_id}")
+async def get_history(
+    session_id: str,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None
+):
+    """Chat history in chronological order; `next_cursor` loads the previous page"""
+    if message_store is None:
+        return {"session_id": session_id, "messages": [], "next_cursor": None}
+    try:
+        messages, next_cursor = await message_store.get_page(session_id, limit, before=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"session_id": session_id, "messages": messages, "next_cursor": next_cursor}
+
+@app.get("/api/admin/sessions", dependencies=[Depends(require_admin)])
+async def get_session_stats():
+    """In-memory session store and summarizer counters"""
+    return {**session_store.stats(), "summarizer": summarizer.stats()}
+
+@app.get("/api/admin/voice-pool", dependencies=[Depends(require_admin)])
+async def get_voice_pool_stats():
+    """Realtime session pool counters"""
+    return voice_pool.stats()
+
+@app.get("/api/admin/persistence", dependencies=[Depends(require_admin)])
+async def get_persistence_stats():
+    """Write-behind queue counters"""
+    return message_writer.stats() if message_writer is not None else {"enabled": False}
+
+@app.post("/api/transcribe", dependencies=[Depends(require_warm)])
+async def transcribe(request: Request):
+    """Transcribe a recorded clip with the local Whisper model.
+
+    Accepts multipart form data with a `file` field (webm/ogg/wav) or the
+    raw clip as the request body; `audio/pcm` means PCM16 mono 16 kHz.
+    """
+    if transcriber is None or not transcriber.ready:
+        raise HTTPException(status_code=503, detail="Transcription not available")
+    try:
+        buffer = audio_buffers.acquire()
+    except AdmissionError as e:
+        logger.warning(f"Transcription rejected: {e}")
+        raise overload_error(e)
+
+    timings = {}
+    started = time.perf_counter()
+    try:
+        try:
+            await buffer.read_from(request)
+        except BodyTooLargeError:
+            raise HTTPException(status_code=413, detail="Audio file too large")
+        content_type = request.headers.get("content-type", "")
+        start, end = 0, buffer.size
+        if content_type.startswith("multipart/form-data"):
+            boundary = multipart_boundary(content_type)
+            part = find_multipart_file(buffer, boundary) if boundary else None
+            if part is None:
+                raise HTTPException(status_code=400, detail="Missing 'file' field")
+            start, end, content_type = part
+        if start >= end:
+            raise HTTPException(status_code=400, detail="Empty audio file")
+
+        view = buffer.view()
+        try:
+            audio = await decode_upload(view[start:end], content_type)
+        finally:
+            view.release()
+        timings["audio_decode_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        # Буфер свободен: дальше работаем только с float32-массивом
+        audio_buffers.release(buffer)
+        buffer = None
+
+        text = await transcriber.transcribe(audio, timings)
+    except AdmissionError as e:
+        logger.warning(f"Transcription rejected: {e}")
+        raise overload_error(e)
+    except DecoderUnavailableError as e:
+        logger.warning(f"Transcription unavailable for {content_type or 'unknown type'}: {e}")
+        raise HTTPException(status_code=503, detail=f"Audio format not supported: {e}")
+    except TranscriptionError as e:
+        logger.warning(f"Transcription failed: {e}")
+        raise HTTPException(status_code=422, detail=str(e))
+    finally:
+        if buffer is not None:
+            audio_buffers.release(buffer)
+    timings["transcribe_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    observe_timings(timings)
+    logger.info(f"Transcribe timings: {timings}")
+    return {"transcription": text, "timings": timings}
+
+@app.websocket("/api/transcribe/stream")
+async def transcribe_stream(websocket: WebSocket):
+    """Live transcription of a microphone stream.
+
+    The client may first send a JSON config
+    {"encoding": "pcm16" | "webm" | "ogg", "session_id": ..., "chat": bool},
+    then binary audio chunks (pcm16: mono 16 kHz little-endian), and
+    {"type": "end"} to flush. The server replies with speech_start, partial
+    and final messages; with "chat" every final utterance is also answered
+    through the chat pipeline as an "answer" message.
+    """
+    # numpy и VAD нужны только потоковому распознаванию
+    from backend.live_transcription import LiveTranscription, FFmpegStreamDecoder, STREAM_ENCODINGS
+
+    await websocket.accept()
+    if not await wait_for_warmup():
+        await websocket.send_json({"type": "error", "detail": "Service is warming up, try again later"})
+        await websocket.close(code=1013)
+        return
+    if transcriber is None or not transcriber.ready:
+        await websocket.send_json({"type": "error", "detail": "Transcription not available"})
+        await websocket.close(code=1013)
+        return
+
+    config = {}
+    first = await websocket.receive()
+    if first["type"] == "websocket.disconnect":
+        return
+    if first.get("text") is not None:
+        try:
+            config = json.loads(first["text"])
+        except ValueError:
+            config = {}
+        if not isinstance(config, dict):
+            config = {}
+    encoding = config.get("encoding", "pcm16")
+    if encoding not in STREAM_ENCODINGS:
+        await websocket.send_json({"type": "error", "detail": f"Unsupported encoding: {encoding}"})
+        await websocket.close(code=1003)
+        return
+    if encoding != "pcm16" and not FFMPEG_AVAILABLE:
+        await websocket.send_json({"type": "error", "detail": f"Encoding {encoding} needs ffmpeg, send pcm16"})
+        await websocket.close(code=1013)
+        return
+    session_id = config.get("session_id") or str(uuid.uuid4())
+
+    async def answer(segment, text):
+        try:
+            response = await chat(ChatRequest(message=text, session_id=session_id))
+        except HTTPException as e:
+            await websocket.send_json({"type": "error", "segment": segment, "detail": e.detail})
+            return
+        await websocket.send_json({"type": "answer", "segment": segment, "response": response.response})
+
+    live = LiveTranscription(transcriber, websocket.send_json, on_final=answer if config.get("chat") else None)
+    decoder = None
+    message = first if first.get("bytes") is not None else None
+    try:
+        if encoding != "pcm16":
+            # Opus приходит кусками контейнера MediaRecorder - декодируем одним потоком ffmpeg
+            decoder = FFmpegStreamDecoder(live.feed)
+            await decoder.start()
+        await websocket.send_json({"type": "ready", "session_id": session_id, "encoding": encoding})
+        while True:
+            if message is None:
+                message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            data, text = message.get("bytes"), message.get("text")
+            message = None
+            if data:
+                if decoder is not None:
+                    await decoder.write(data)
+                else:
+                    await live.feed_pcm16(data)
+            elif text:
+                control = json.loads(text)
+                if not isinstance(control, dict):
+                    raise ValueError("Control messages must be JSON objects")
+                if control.get("type") == "end":
+                    break
+        if decoder is not None:
+            await decoder.close()
+        await live.finish()
+        await websocket.send_json({"type": "done", "segments": live.segment_index})
+        await websocket.close()
+    except WebSocketDisconnect:
+        logger.info(f"Live transcription client disconnected after {live.segment_index} segment(s)")
+    except DecoderUnavailableError as e:
+        await websocket.send_json({"type": "error", "detail": str(e)})
+        await websocket.close(code=1013)
+    except (TranscriptionError, ValueError) as e:
+        await websocket.send_json({"type": "error", "detail": str(e)})
+        await websocket.close(code=1008)
+    except OSError as e:
+        # ffmpeg закрыл вход (BrokenPipeError, ConnectionResetError)
+        logger.warning(f"Live transcription decoder failed: {e}")
+        await websocket.send_json({"type": "error", "detail": "Audio decoder failed"})
+        await websocket.close(code=1011)
+    finally:
+        if decoder is not None:
+            await decoder.close()
+        live.cancel()
+
+@app.post("/api/chat", response_model=ChatResponse, dependencies=[Depends(require_warm)])
 async def chat(request: ChatRequest):
+    timings = {}
     try:
-        # Save user message (if MongoDB available)
-        if db:
-            user_message = ChatMessage(
-                id=str(uuid.uuid4()),
-                session_id=request.session_id,
-                content=request.message,
-                role="user",
-                timestamp=datetime.now(timezone.utc)
-            )
-            
-            user_msg_dict = prepare_for_mongo(user_message.model_dump())
-            await db.messages.insert_one(user_msg_dict)
-
-            # Get chat history
-            history = await db.messages.find(
-                {"session_id": request.session_id}
-            ).sort("timestamp", 1).to_list(length=50)
-        else:
-            # No MongoDB - just log the message
-            logger.info(f"User message: {request.message}")
-
-        # Generate response using OpenAI
-        api_key = os.environ.get("OPENAI_API_KEY")
-        if not api_key:
-            raise HTTPException(status_code=500, detail="OpenAI API key not configured")
-        
-        if not INTEGRATION_AVAILABLE:
-            raise HTTPException(status_code=500, detail="OpenAI integration not available")
-        
-        client = OpenAI(api_key=api_key)
-        
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": request.message}
-            ],
-            max_tokens=1000,
-            temperature=0.7
-        )
-        ai_response = response.choices[0].message.content
-
-        # Save assistant response (if MongoDB available)
-        if db:
-            assistant_message = ChatMessage(
-                id=str(uuid.uuid4()),
-                session_id=request.session_id,
-                content=ai_response,
-                role="assistant",
-                timestamp=datetime.now(timezone.utc)
-            )
+        summary, history = context_turns(request.session_id, timings)
+
+        # Save user message (queued, not awaited on the database)
+        await persist_message(request.session_id, "user", request.message)
+
+        # Direct article requests and FAQ intents are answered locally
+        ai_response = answer_from_corpus(request.message) or answer_from_faq(request.message, timings)
+
+        # Кэш и объединение запросов - только для вопросов без предыдущего контекста,
+        # иначе ответ зависит от истории диалога
+        key = answer_cache_key(request.message) if not history and not summary else None
+        # Уточняющие вопросы зависят от контекста - классифицируем только первый вопрос
+        if ai_response is None and key is not None:
+            ai_response = refuse_off_topic(request.message, timings)
+        vector = None
+        if ai_response is None and key is not None:
+            ai_response, vector = await find_cached_answer(request.message, key, timings)
+
+        if ai_response is None:
+            # Generate response using OpenAI
+            client = require_llm_client()
+            messages = build_messages(request.message, timings, history, summary)
+
+            async def generate():
+                async with llm_scheduler.slot(PRIORITY_CHAT):
+                    response = await client.chat.completions.create(
+                        model=CHAT_MODEL,
+                        messages=messages,
+                        max_tokens=1000,
+                        temperature=0.7
+                    )
+                answer = response.choices[0].message.content
+                if response.usage is not None:
+                    log_usage(response.usage.model_dump(), timings)
+                if key is not None:
+                    remember_answer(key, vector, answer, request.message)
+                return answer
             
-            assistant_msg_dict = prepare_for_mongo(assistant_message.model_dump())
-            await db.messages.insert_one(assistant_msg_dict)
-        else:
-            # No MongoDB - just log the response
-            logger.info(f"Assistant response: {ai_response}")
+            started = time.perf_counter()
+            flight_key = key or f"{request.session_id}:{uuid.uuid4()}"
+            ai_response, is_leader = await chat_flights.do(flight_key, generate)
+            timings["llm_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            timings["coalesced"] = not is_leader
+
+        # Save assistant response
+        await persist_message(request.session_id, "assistant", ai_response)
 
+        observe_timings(timings)
+        logger.info(f"Chat timings: {timings}")
         return ChatResponse(
             response=ai_response,
             session_id=request.session_id,
             message_id=str(uuid.uuid4())
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
+        overload = overload_error(e)
+        if overload is not None:
+            logger.warning(f"Chat rejected: {e}")
+            raise overload
         logger.error(f"Error in chat: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 # Voice Mode endpoints
-@app.post("/api/voice/realtime/session")
+@app.post("/api/voice/realtime/session", dependencies=[Depends(require_warm)])
 async def create_aleya_session(request: Request):
     """Create session with Алеся system prompt"""
     try:
         if not VOICE_MODE_AVAILABLE:
             raise HTTPException(status_code=503, detail="Voice Mode not available")
         
-        api_key = os.environ.get("OPENAI_API_KEY")
-        if not api_key:
-            raise HTTPException(status_code=500, detail="OpenAI API key not configured")
-        
-        # Get request body if any
-        body = {}
-        try:
-            body = await request.json()
-        except:
-            pass
-        
-        # Create OpenAI client
-        client = OpenAI(api_key=api_key)
-        
-        # Create session with custom instructions
-        session = client.beta.realtime.sessions.create(
-            model="gpt-4o-realtime-preview-2024-12-17",
-            voice="shimmer",
-            instructions="Ты консультант по Конституции Республики Беларусь. Отвечай только по Конституции 2022 года, всегда указывай номер статьи. Если вопрос не относится к Конституции — вежливо отказывай."
-        )
-        
-        return {"session_id": session.id}
+        require_llm_client()
+
+        # Сессия из пула выдается сразу; при промахе создаем ее как раньше
+        session = voice_pool.acquire()
+        if session is None:
+            session = await create_realtime_session()
+        return session
     except HTTPException:
         raise
     except Exception as e:
+        overload = overload_error(e)
+        if overload is not None:
+            logger.warning(f"Voice session rejected: {e}")
+            raise overload
         logger.error(f"Error creating voice session: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 # Streaming chat endpoint
-@app.post("/api/chat/stream")
+@app.post("/api/chat/stream", dependencies=[Depends(require_warm)])
 async def chat_stream(request: ChatRequest):
     """Streaming chat endpoint for real-time responses"""
-    
-    def generate_stream():
+    timings = {}
+    summary, history = context_turns(request.session_id, timings)
+    key = answer_cache_key(request.message) if not history and not summary else None
+    vector = None
+
+    # Быстрые ответы (статья по номеру, кэш) не занимают слот планировщика
+    ready_answer = answer_from_corpus(request.message) or answer_from_faq(request.message, timings)
+    if ready_answer is None and key is not None:
+        ready_answer = refuse_off_topic(request.message, timings)
+    if ready_answer is None and key is not None:
+        ready_answer, vector = await find_cached_answer(request.message, key, timings)
+
+    await persist_message(request.session_id, "user", request.message)
+
+    async def ready_stream():
+        yield sse_event({'delta': ready_answer, 'done': False})
+        yield sse_event({'content': ready_answer, 'done': True, 'usage': None})
+        await persist_message(request.session_id, "assistant", ready_answer)
+        observe_timings(timings)
+
+    def error_stream(detail):
+        async def stream():
+            yield sse_event({'error': detail})
+        return stream()
+
+    if ready_answer is not None:
+        return StreamingResponse(ready_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+    try:
+        client = require_llm_client()
+    except HTTPException as e:
+        return StreamingResponse(error_stream(e.detail), media_type="text/event-stream", headers=SSE_HEADERS)
+
+    messages = build_messages(request.message, timings, history, summary)
+    flight_key = key or f"{request.session_id}:{uuid.uuid4()}"
+
+    async def produce(shared):
+        # Слот берет только лидер, уже после join: одинаковые вопросы ждут его
+        # допуска, а не занимают каждый свое место в очереди
         try:
-            api_key = os.environ.get("OPENAI_API_KEY")
-            if not api_key:
-                yield f"data: {json.dumps({'error': 'OpenAI API key not configured'})}\n\n"
-                return
-            
-            if not INTEGRATION_AVAILABLE:
-                yield f"data: {json.dumps({'error': 'OpenAI integration not available'})}\n\n"
-                return
-            
-            client = OpenAI(api_key=api_key)
-            response = client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": SYSTEM_PROMPT},
-                    {"role": "user", "content": request.message}
-                ],
+            await llm_scheduler.acquire(PRIORITY_CHAT)
+        except AdmissionError as e:
+            logger.warning(f"Chat stream rejected: {e}")
+            shared.finish(error=e)
+            return
+        shared.admit()
+        started = time.monotonic()
+        try:
+            completion = ChatCompletionStream(
+                client,
+                model=CHAT_MODEL,
+                messages=messages,
                 max_tokens=1000,
                 temperature=0.7
             )
-            response_text = response.choices[0].message.content
-            
-            # Simulate streaming by sending words one by one
-            words = response_text.split()
-            current_response = ""
-            for word in words:
-                current_response += word + " "
-                yield f"data: {json.dumps({'content': current_response, 'done': False})}\n\n"
+            async for delta in completion:
+                shared.publish(delta)
+            log_usage(completion.usage, timings)
+            if key is not None:
+                remember_answer(key, vector, completion.text, request.message)
+            shared.finish(usage=completion.usage)
+        finally:
+            llm_scheduler.release(time.monotonic() - started)
+
+    shared, is_leader = stream_flights.join(flight_key, produce)
+
+    # Ждем допуска до начала ответа, чтобы вернуть 429/503 всем участникам сразу
+    try:
+        await shared.wait_admitted()
+    except Exception as e:
+        overload = overload_error(e)
+        if overload is not None:
+            raise overload
+        return StreamingResponse(error_stream(str(e)), media_type="text/event-stream", headers=SSE_HEADERS)
+
+    async def generate_stream():
+        try:
+            # Пересылаем токены по мере генерации, только дельты;
+            # повторные одинаковые вопросы читают тот же поток с начала
+            started = time.perf_counter()
+            timings["coalesced"] = not is_leader
+            async for delta in coalesce_deltas(shared.subscribe()):
+                if "llm_first_token_ms" not in timings:
+                    timings["llm_first_token_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                yield sse_event({'delta': delta, 'done': False})
+            timings["llm_ms"] = round((time.perf_counter() - started) * 1000, 1)
                 
-            yield f"data: {json.dumps({'content': current_response.strip(), 'done': True})}\n\n"
+            yield sse_event({'content': shared.text, 'done': True, 'usage': shared.usage})
+            await persist_message(request.session_id, "assistant", shared.text)
+            observe_timings(timings)
+            logger.info(f"Chat stream timings: {timings}")
         
         except Exception as e:
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+            logger.error(f"Error in chat stream: {e}")
+            yield sse_event({'error': str(e)})
 
-    return StreamingResponse(generate_stream(), media_type="text/plain")
+    return StreamingResponse(
+        generate_stream(),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,154 @@
+"""Bounded in-process conversation memory"""
+import os
+import sys
+import time
+from collections import OrderedDict, deque
+
+SESSION_MAX_SESSIONS = int(os.environ.get("SESSION_MAX_SESSIONS", 50000))
+SESSION_MAX_BYTES = int(os.environ.get("SESSION_MAX_BYTES", 256 * 1024 * 1024))
+SESSION_MAX_MESSAGES = int(os.environ.get("SESSION_MAX_MESSAGES", 40))
+SESSION_TTL = float(os.environ.get("SESSION_TTL", 6 * 3600))
+
+
+class MessageRecord:
+    """Compact message: four slots instead of a pydantic model with a dict"""
+
+    __slots__ = ("role", "content", "timestamp", "tokens")
+
+    def __init__(self, role, content, timestamp, tokens=None):
+        self.role = sys.intern(role)
+        self.content = content
+        self.timestamp = timestamp
+        self.tokens = tokens
+
+    def size(self):
+        return _RECORD_OVERHEAD + sys.getsizeof(self.content)
+
+
+_RECORD_OVERHEAD = sys.getsizeof(MessageRecord("user", "", 0.0)) + sys.getsizeof(0.0)
+
+
+class Session:
+    """Ring buffer of the latest messages of one conversation"""
+
+    __slots__ = ("session_id", "messages", "last_access", "bytes",
+                 "summary", "summary_tokens", "summarizing")
+
+    def __init__(self, session_id, max_messages):
+        self.session_id = session_id
+        self.messages = deque(maxlen=max_messages)
+        self.last_access = time.monotonic()
+        self.bytes = SESSION_OVERHEAD
+        # Сжатое содержание реплик, уже вытесненных из буфера
+        self.summary = None
+        self.summary_tokens = 0
+        self.summarizing = False
+
+
+# Session со слотами, пустой deque и запись в OrderedDict
+SESSION_OVERHEAD = sys.getsizeof(object.__new__(Session)) + sys.getsizeof(deque(maxlen=1)) + 100
+
+
+class SessionStore:
+    """Sessions in LRU order, bounded by count, total bytes and idle TTL"""
+
+    def __init__(self, max_sessions=SESSION_MAX_SESSIONS, max_bytes=SESSION_MAX_BYTES,
+                 max_messages=SESSION_MAX_MESSAGES, ttl=SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.max_messages = max_messages
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self.bytes = 0
+        self.messages = 0
+        self.evicted = 0
+        self.expired = 0
+
+    def get(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        if time.monotonic() - session.last_access > self.ttl:
+            self._drop(session_id)
+            self.expired += 1
+            return None
+        self._touch(session)
+        return session
+
+    def append(self, session_id, role, content, tokens=None):
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = Session(session_id, self.max_messages)
+            self.bytes += session.bytes
+        self._touch(session)
+
+        if len(session.messages) == session.messages.maxlen:
+            dropped = session.messages.popleft()
+            session.bytes -= dropped.size()
+            self.bytes -= dropped.size()
+            self.messages -= 1
+
+        record = MessageRecord(role, content, time.time(), tokens)
+        session.messages.append(record)
+        session.bytes += record.size()
+        self.bytes += record.size()
+        self.messages += 1
+        self._evict()
+        return record
+
+    def compact(self, session, folded, summary, summary_tokens):
+        """Replace the oldest `folded` records with an updated rolling summary"""
+        if self._sessions.get(session.session_id) is not session:
+            return False  # сессия уже вытеснена
+        for record in folded:
+            if not session.messages or session.messages[0] is not record:
+                break
+            session.messages.popleft()
+            session.bytes -= record.size()
+            self.bytes -= record.size()
+            self.messages -= 1
+        size_delta = sys.getsizeof(summary) - (sys.getsizeof(session.summary) if session.summary else 0)
+        session.summary = summary
+        session.summary_tokens = summary_tokens
+        session.bytes += size_delta
+        self.bytes += size_delta
+        return True
+
+    def _touch(self, session):
+        session.last_access = time.monotonic()
+        self._sessions.move_to_end(session.session_id)
+
+    def _drop(self, session_id):
+        session = self._sessions.pop(session_id)
+        self.bytes -= session.bytes
+        self.messages -= len(session.messages)
+
+    def _evict(self):
+        now = time.monotonic()
+        # Первые в OrderedDict - дольше всех не использовались
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_access > self.ttl:
+                self._drop(session_id)
+                self.expired += 1
+            elif len(self._sessions) > self.max_sessions or self.bytes > self.max_bytes:
+                self._drop(session_id)
+                self.evicted += 1
+            else:
+                break
+
+    def stats(self):
+        return {
+            "sessions": len(self._sessions),
+            "messages": self.messages,
+            "bytes": self.bytes,
+            "max_sessions": self.max_sessions,
+            "max_bytes": self.max_bytes,
+            "max_messages_per_session": self.max_messages,
+            "ttl_seconds": self.ttl,
+            "evicted": self.evicted,
+            "expired": self.expired,
+        }
+
+
+session_store = SessionStore()
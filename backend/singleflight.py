@@ -0,0 +1,145 @@
+"""Coalescing of identical in-flight upstream requests"""
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _consume_result(task):
+    # Не даём asyncio ругаться на "exception was never retrieved",
+    # если все ожидающие запросы уже отменены
+    if not task.cancelled():
+        task.exception()
+
+
+class SingleFlight:
+    """Run at most one call per key; concurrent callers share its result.
+
+    The call runs in its own task, so a disconnecting leader does not cancel
+    the work the followers are waiting for.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key, fn):
+        """Return (result, is_leader)"""
+        task = self._calls.get(key)
+        is_leader = task is None
+        if is_leader:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+            self.leaders += 1
+        else:
+            self.followers += 1
+        return await asyncio.shield(task), is_leader
+
+    def _forget(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        _consume_result(task)
+
+    def in_flight(self):
+        return len(self._calls)
+
+
+class ReplayStream:
+    """Token stream that any number of subscribers can read from the start"""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.usage = None
+        self.admission_error = None
+        self._changed = asyncio.Event()
+        self._admitted = asyncio.Event()
+
+    @property
+    def text(self):
+        return "".join(self.chunks)
+
+    def publish(self, chunk):
+        self.chunks.append(chunk)
+        self._notify()
+
+    def admit(self):
+        """Mark the producer as admitted upstream"""
+        self._admitted.set()
+
+    async def wait_admitted(self):
+        """Wait until the producer is admitted; raise the error that ended it before that"""
+        await self._admitted.wait()
+        if self.admission_error is not None:
+            raise self.admission_error
+
+    def finish(self, usage=None, error=None):
+        if not self._admitted.is_set():
+            # Поток закончился до допуска - все подписчики получают ту же ошибку
+            self.admission_error = error
+            self._admitted.set()
+        self.usage = usage
+        self.error = error
+        self.done = True
+        self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def subscribe(self):
+        position = 0
+        while True:
+            while position < len(self.chunks):
+                yield self.chunks[position]
+                position += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+
+class StreamSingleFlight:
+    """Share one upstream token stream between identical concurrent requests"""
+
+    def __init__(self):
+        self._streams = {}
+        self._tasks = set()
+        self.leaders = 0
+        self.followers = 0
+
+    def join(self, key, produce):
+        """Return (stream, is_leader); `produce(stream)` runs once per key"""
+        stream = self._streams.get(key)
+        if stream is not None:
+            self.followers += 1
+            return stream, False
+
+        stream = ReplayStream()
+        self._streams[key] = stream
+        self.leaders += 1
+
+        async def run():
+            try:
+                await produce(stream)
+            except Exception as e:
+                logger.error(f"Error in shared stream: {e}")
+                stream.finish(error=e)
+            finally:
+                if not stream.done:
+                    stream.finish(error=RuntimeError("stream cancelled"))
+                if self._streams.get(key) is stream:
+                    del self._streams[key]
+
+        task = asyncio.ensure_future(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        task.add_done_callback(_consume_result)
+        return stream, True
+
+    def in_flight(self):
+        return len(self._streams)
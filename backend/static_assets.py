@@ -0,0 +1,182 @@
+"""Frontend assets served from memory: precompressed, content-hashed, ETag-validated"""
+import os
+import re
+import gzip
+import hashlib
+import logging
+import mimetypes
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+    logger.info("brotli not installed, static assets are precompressed with gzip only")
+
+STATIC_ROOT = os.environ.get("STATIC_ROOT", "docs")
+# Меньше этого сжатие не окупает заголовки
+STATIC_COMPRESS_MIN_BYTES = int(os.environ.get("STATIC_COMPRESS_MIN_BYTES", 512))
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+
+# static/js/main.js в атрибутах index.html
+_ASSET_REFERENCE = re.compile(r"""(?<=["'(])(/?static/)([^"'()?#\s]+)""")
+
+
+@dataclass
+class StaticAsset:
+    body: bytes
+    content_type: str
+    digest: str
+    # Кодировка -> сжатое тело; "identity" не хранится отдельно
+    encoded: Dict[str, bytes] = field(default_factory=dict)
+
+    def etag(self, encoding):
+        # Разные представления - разные сильные ETag
+        suffix = "" if encoding == "identity" else f"-{encoding}"
+        return f'"{self.digest}{suffix}"'
+
+    def variant(self, accept_encoding):
+        """Pick the smallest representation the client accepts"""
+        accepted = _accepted_encodings(accept_encoding)
+        for encoding in ("br", "gzip"):
+            if encoding in self.encoded and encoding in accepted:
+                return encoding, self.encoded[encoding]
+        return "identity", self.body
+
+
+def _accepted_encodings(header):
+    accepted = set()
+    for item in (header or "").split(","):
+        name, _, params = item.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q=") and q[2:].strip() in ("0", "0.0", "0.00", "0.000"):
+            continue
+        if name:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def _compress(body, content_type):
+    encoded = {}
+    if len(body) < STATIC_COMPRESS_MIN_BYTES or not content_type.startswith(COMPRESSIBLE_TYPES):
+        return encoded
+    # mtime=0: одинаковый результат на всех репликах и деплоях
+    compressed = gzip.compress(body, compresslevel=9, mtime=0)
+    if len(compressed) < len(body):
+        encoded["gzip"] = compressed
+    if BROTLI_AVAILABLE:
+        compressed = brotli.compress(body, quality=11)
+        if len(compressed) < len(body):
+            encoded["br"] = compressed
+    return encoded
+
+
+def _make_asset(body, path):
+    content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    if content_type.startswith("text/") or content_type == "application/javascript":
+        content_type += "; charset=utf-8"
+    digest = hashlib.sha256(body).hexdigest()[:16]
+    return StaticAsset(body, content_type, digest, _compress(body, content_type))
+
+
+def hashed_name(path, digest):
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{digest[:10]}{ext}"
+
+
+class StaticAssets:
+    """All files under `<root>/static` plus index.html, loaded once.
+
+    Every asset is reachable at its plain path (revalidated on each use) and
+    at a content-hashed path such as js/main.3f2a9c1b7e.js that is cached
+    forever; index.html is rewritten to reference the hashed paths, so a
+    deploy changes the URLs and browsers never see stale code.
+    """
+
+    def __init__(self, root=STATIC_ROOT):
+        self.root = root
+        self.assets = {}
+        self.immutable = set()
+        self.index = None
+
+    @classmethod
+    def load(cls, root=STATIC_ROOT):
+        instance = cls(root)
+        static_dir = os.path.join(root, "static")
+        hashed = {}
+        for directory, _, files in os.walk(static_dir):
+            for name in sorted(files):
+                full_path = os.path.join(directory, name)
+                path = os.path.relpath(full_path, static_dir).replace(os.sep, "/")
+                with open(full_path, "rb") as f:
+                    asset = _make_asset(f.read(), path)
+                hashed[path] = hashed_name(path, asset.digest)
+                instance.assets[path] = asset
+                instance.assets[hashed[path]] = asset
+                instance.immutable.add(hashed[path])
+
+        index_path = os.path.join(root, "index.html")
+        if os.path.exists(index_path):
+            with open(index_path, encoding="utf-8") as f:
+                html = f.read()
+            html = _ASSET_REFERENCE.sub(
+                lambda m: m.group(1) + hashed.get(m.group(2), m.group(2)), html
+            )
+            instance.index = _make_asset(html.encode("utf-8"), "index.html")
+
+        unique = {asset.digest: asset for asset in instance.assets.values()}.values()
+        raw = sum(len(asset.body) for asset in unique)
+        smallest = sum(min(len(b) for b in (asset.body, *asset.encoded.values())) for asset in unique)
+        logger.info(
+            f"Static assets loaded from {root}: {len(hashed)} files, {raw} -> {smallest} bytes compressed, "
+            f"brotli {'on' if BROTLI_AVAILABLE else 'off'}"
+        )
+        return instance
+
+    def get(self, path):
+        """Return (asset, cache-control) for a path under /static, or (None, None)"""
+        asset = self.assets.get(path)
+        if asset is None:
+            return None, None
+        return asset, IMMUTABLE_CACHE if path in self.immutable else REVALIDATE_CACHE
+
+
+def asset_response_parts(asset, cache_control, accept_encoding, if_none_match):
+    """Status, headers and body for serving `asset`, honouring If-None-Match.
+
+    Returned as plain values so the web layer builds the response object.
+    """
+    encoding, body = asset.variant(accept_encoding)
+    headers = {
+        "ETag": asset.etag(encoding),
+        "Cache-Control": cache_control,
+        "Vary": "Accept-Encoding",
+    }
+    if _etag_matches(if_none_match, asset):
+        return 304, headers, b""
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return 200, headers, body
+
+
+def _etag_matches(header, asset):
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match сравнивается слабо: W/"x" совпадает с "x"
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return any(asset.etag(encoding) in tags for encoding in ("identity", *asset.encoded))
+
+
+@lru_cache(maxsize=1)
+def get_static_assets() -> StaticAssets:
+    return StaticAssets.load()
@@ -0,0 +1,256 @@
+"""Message storage backends"""
+import os
+import json
+import queue
+import base64
+import asyncio
+import logging
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Поля, которые отдаются клиенту в истории
+HISTORY_FIELDS = ("id", "role", "content", "timestamp")
+
+
+def encode_cursor(message):
+    """Opaque keyset cursor from the (timestamp, id) of a message"""
+    raw = json.dumps([message["timestamp"].isoformat(), message["id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Return (timestamp, id); raises ValueError on a malformed cursor"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, message_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(timestamp), str(message_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+
+class MessageStore(ABC):
+    """Interface shared by all message backends.
+
+    Pages are keyset-paginated on (timestamp, id): `get_page` returns the
+    newest `limit` messages older than `before` in chronological order, plus
+    a cursor for the next (older) page or None.
+    """
+
+    async def ensure_indexes(self):
+        pass
+
+    @abstractmethod
+    async def insert_many(self, docs):
+        pass
+
+    @abstractmethod
+    async def get_page(self, session_id, limit, before=None):
+        pass
+
+    async def close(self):
+        pass
+
+
+def _page_result(rows, limit):
+    # rows: newest first, up to limit + 1
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(rows[-1]) if has_more and rows else None
+    rows.reverse()
+    return rows, next_cursor
+
+
+class MongoMessageStore(MessageStore):
+    """Messages collection in MongoDB, accessed through Motor"""
+
+    def __init__(self, db, collection="messages"):
+        self.collection = db[collection]
+
+    async def ensure_indexes(self):
+        await self.collection.create_index(
+            [("session_id", 1), ("timestamp", 1), ("id", 1)],
+            name="session_timestamp"
+        )
+
+    async def insert_many(self, docs):
+        await self.collection.insert_many(docs, ordered=False)
+
+    async def get_page(self, session_id, limit, before=None):
+        query = {"session_id": session_id}
+        if before is not None:
+            timestamp, message_id = decode_cursor(before)
+            query["$or"] = [
+                {"timestamp": {"$lt": timestamp}},
+                {"timestamp": timestamp, "id": {"$lt": message_id}},
+            ]
+        projection = {field: 1 for field in HISTORY_FIELDS}
+        projection["_id"] = 0
+        rows = await self.collection.find(query, projection).sort(
+            [("timestamp", -1), ("id", -1)]
+        ).limit(limit + 1).to_list(length=limit + 1)
+        return _page_result(rows, limit)
+
+
+def _sqlite_timestamp(value):
+    # Фиксированный формат UTC: лексикографический порядок = хронологический
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f+00:00")
+
+
+class SQLiteMessageStore(MessageStore):
+    """Embedded SQLite store in WAL mode.
+
+    All writes go through one dedicated writer thread that groups whatever
+    batches are waiting into a single transaction; reads run in the default
+    executor on per-thread connections. Statements are constant SQL strings,
+    so sqlite3's statement cache reuses the prepared statements.
+    """
+
+    INSERT_SQL = (
+        "INSERT OR IGNORE INTO messages (id, session_id, role, content, timestamp) "
+        "VALUES (?, ?, ?, ?, ?)"
+    )
+    PAGE_SQL = (
+        "SELECT id, role, content, timestamp FROM messages "
+        "WHERE session_id = ? ORDER BY timestamp DESC, id DESC LIMIT ?"
+    )
+    PAGE_BEFORE_SQL = (
+        "SELECT id, role, content, timestamp FROM messages "
+        "WHERE session_id = ? AND (timestamp < ? OR (timestamp = ? AND id < ?)) "
+        "ORDER BY timestamp DESC, id DESC LIMIT ?"
+    )
+
+    def __init__(self, path, max_batch=500):
+        self.path = path
+        self.max_batch = max_batch
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        # Соединения читателей из всех потоков executor'а - закрываются в close()
+        self._readers = []
+        self._readers_lock = threading.Lock()
+        self._writes = queue.Queue()
+        self._writer = None
+        self.commits = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=64)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+
+    async def ensure_indexes(self):
+        def create():
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS messages ("
+                    "id TEXT PRIMARY KEY, session_id TEXT NOT NULL, role TEXT NOT NULL, "
+                    "content TEXT NOT NULL, timestamp TEXT NOT NULL)"
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS session_timestamp "
+                    "ON messages (session_id, timestamp, id)"
+                )
+            conn.close()
+        await asyncio.to_thread(create)
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_loop, name="sqlite-writer", daemon=True)
+            self._writer.start()
+        logger.info(f"SQLite message store ready: {self.path}")
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            item = self._writes.get()
+            if item is None:
+                break
+            pending = [item]
+            rows = list(item[0])
+            # Склеиваем все ожидающие пачки в одну транзакцию
+            while len(rows) < self.max_batch:
+                try:
+                    item = self._writes.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._writes.put(None)
+                    break
+                pending.append(item)
+                rows.extend(item[0])
+            error = None
+            try:
+                with conn:
+                    conn.executemany(self.INSERT_SQL, rows)
+                self.commits += 1
+            except Exception as e:
+                error = e
+            for _, loop, future in pending:
+                try:
+                    loop.call_soon_threadsafe(_resolve, future, error)
+                except RuntimeError:
+                    pass  # event loop already closed
+        conn.close()
+
+    async def insert_many(self, docs):
+        rows = [
+            (doc["id"], doc["session_id"], doc["role"], doc["content"], _sqlite_timestamp(doc["timestamp"]))
+            for doc in docs
+        ]
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._writes.put((rows, loop, future))
+        await future
+
+    async def get_page(self, session_id, limit, before=None):
+        if before is not None:
+            timestamp, message_id = decode_cursor(before)
+            timestamp = _sqlite_timestamp(timestamp)
+            params = (session_id, timestamp, timestamp, message_id, limit + 1)
+            sql = self.PAGE_BEFORE_SQL
+        else:
+            params = (session_id, limit + 1)
+            sql = self.PAGE_SQL
+
+        def fetch():
+            return self._reader().execute(sql, params).fetchall()
+
+        rows = [
+            {"id": r[0], "role": r[1], "content": r[2], "timestamp": datetime.fromisoformat(r[3])}
+            for r in await asyncio.to_thread(fetch)
+        ]
+        return _page_result(rows, limit)
+
+    async def close(self):
+        if self._writer is not None:
+            self._writes.put(None)
+            await asyncio.to_thread(self._writer.join)
+            self._writer = None
+        with self._readers_lock:
+            readers, self._readers = self._readers, []
+            # Потоки executor'а переживают store: следующее чтение откроет новое соединение
+            self._local = threading.local()
+        for conn in readers:
+            conn.close()
+
+
+def _resolve(future, error):
+    if future.done():
+        return
+    if error is None:
+        future.set_result(None)
+    else:
+        future.set_exception(error)
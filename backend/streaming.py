@@ -0,0 +1,73 @@
+"""Server-Sent Events helpers for /api/chat/stream"""
+import os
+import json
+import time
+import asyncio
+
+# Мелкие токены склеиваются в один кадр не чаще, чем раз в STREAM_FLUSH_INTERVAL
+STREAM_FLUSH_INTERVAL = float(os.environ.get("STREAM_FLUSH_INTERVAL", 0.05))
+STREAM_MAX_PENDING_CHARS = int(os.environ.get("STREAM_MAX_PENDING_CHARS", 256))
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+
+def sse_event(payload):
+    """Format one SSE frame"""
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+async def coalesce_deltas(deltas, interval=STREAM_FLUSH_INTERVAL,
+                          max_pending=STREAM_MAX_PENDING_CHARS):
+    """Group small text deltas into larger chunks.
+
+    The first delta is passed through immediately to keep time-to-first-byte
+    low; after that pending text is flushed once `interval` seconds have
+    passed or `max_pending` characters have accumulated. The interval is
+    timed, so text buffered before an upstream pause goes out without
+    waiting for the next delta.
+    """
+    iterator = deltas.__aiter__()
+    pending = []
+    pending_len = 0
+    last_flush = None
+    next_delta = None
+    try:
+        while True:
+            if next_delta is None:
+                # Задача живет между таймаутами: отмена __anext__ сломала бы источник
+                next_delta = asyncio.ensure_future(iterator.__anext__())
+            if pending:
+                timeout = max(0.0, last_flush + interval - time.monotonic())
+                done, _ = await asyncio.wait({next_delta}, timeout=timeout)
+                if not done:
+                    yield "".join(pending)
+                    pending = []
+                    pending_len = 0
+                    last_flush = time.monotonic()
+                    continue
+            try:
+                delta = await next_delta
+            except StopAsyncIteration:
+                next_delta = None
+                break
+            next_delta = None
+            now = time.monotonic()
+            if last_flush is None:
+                last_flush = now
+                yield delta
+                continue
+            pending.append(delta)
+            pending_len += len(delta)
+            if now - last_flush >= interval or pending_len >= max_pending:
+                yield "".join(pending)
+                pending = []
+                pending_len = 0
+                last_flush = now
+        if pending:
+            yield "".join(pending)
+    finally:
+        if next_delta is not None:
+            next_delta.cancel()
@@ -0,0 +1,85 @@
+"""Incremental rolling summaries of long sessions"""
+import os
+import time
+import asyncio
+import logging
+
+from backend.scheduler import llm_scheduler, PRIORITY_BACKGROUND
+from backend.tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Сжимаем, когда несжатых реплик больше SUMMARY_TRIGGER_MESSAGES; последние SUMMARY_KEEP_RECENT остаются как есть
+SUMMARY_TRIGGER_MESSAGES = int(os.environ.get("SUMMARY_TRIGGER_MESSAGES", 12))
+SUMMARY_KEEP_RECENT = int(os.environ.get("SUMMARY_KEEP_RECENT", 4))
+SUMMARY_MODEL = os.environ.get("OPENAI_SUMMARY_MODEL", "gpt-4o-mini")
+SUMMARY_MAX_TOKENS = int(os.environ.get("SUMMARY_MAX_TOKENS", 300))
+
+SUMMARY_PROMPT = """Ты ведешь краткое резюме консультации по Конституции Республики Беларусь.
+Обнови резюме с учетом новых реплик. Сохрани темы вопросов, упомянутые номера статей
+и важные факты о пользователе. Пиши по-русски, не более 150 слов, без вступлений."""
+
+
+class SessionSummarizer:
+    """Folds old turns into a per-session summary in background tasks"""
+
+    def __init__(self, store, get_client):
+        self.store = store
+        self.get_client = get_client
+        self._tasks = set()
+        self.runs = 0
+        self.failures = 0
+
+    def maybe_schedule(self, session_id):
+        session = self.store.get(session_id)
+        if session is None or session.summarizing:
+            return False
+        if len(session.messages) <= SUMMARY_TRIGGER_MESSAGES:
+            return False
+        client = self.get_client()
+        if client is None:
+            return False
+        session.summarizing = True
+        task = asyncio.create_task(self._summarize(session, client))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def _summarize(self, session, client):
+        folded = list(session.messages)[:-SUMMARY_KEEP_RECENT]
+        started = time.perf_counter()
+        try:
+            transcript = "\n".join(
+                f"{'Пользователь' if r.role == 'user' else 'Алеся'}: {r.content}" for r in folded
+            )
+            previous = session.summary or "(пока пусто)"
+            async with llm_scheduler.slot(PRIORITY_BACKGROUND):
+                response = await client.chat.completions.create(
+                    model=SUMMARY_MODEL,
+                    messages=[
+                        {"role": "system", "content": SUMMARY_PROMPT},
+                        {"role": "user", "content": f"Текущее резюме:\n{previous}\n\nНовые реплики:\n{transcript}"}
+                    ],
+                    max_tokens=SUMMARY_MAX_TOKENS,
+                    temperature=0.2
+                )
+            summary = response.choices[0].message.content.strip()
+            self.store.compact(session, folded, summary, count_tokens(summary))
+            self.runs += 1
+            logger.info(
+                f"Session {session.session_id} summarized: {len(folded)} messages folded "
+                f"in {round((time.perf_counter() - started) * 1000, 1)} ms"
+            )
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Session summary failed for {session.session_id}: {e}")
+        finally:
+            session.summarizing = False
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self):
+        return {"running": len(self._tasks), "runs": self.runs, "failures": self.failures}
@@ -0,0 +1,67 @@
+"""Token counting for prompt budgeting"""
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError as e:
+    TIKTOKEN_AVAILABLE = False
+    logger.warning(f"tiktoken not available, using approximate token counts: {e}")
+
+# Служебные токены на каждое сообщение в формате chat completions
+MESSAGE_TOKEN_OVERHEAD = 4
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 2000))
+
+
+# Повторная попытка загрузки после неудачи - не чаще чем раз в интервал
+ENCODING_RETRY_INTERVAL = float(os.environ.get("ENCODING_RETRY_INTERVAL", 60))
+
+_encodings = {}
+_failed_at = {}
+
+
+def get_encoding(model):
+    """Encoding for the model, or None when tiktoken is not installed.
+
+    tiktoken downloads the BPE file on first use, so this is warmed up at
+    startup rather than on the first request. A failed load raises and is
+    not cached: the next call tries again.
+    """
+    if not TIKTOKEN_AVAILABLE:
+        return None
+    encoding = _encodings.get(model)
+    if encoding is None:
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+        _encodings[model] = encoding
+        _failed_at.pop(model, None)
+    return encoding
+
+
+def _encoding_or_none(model):
+    encoding = _encodings.get(model)
+    if encoding is not None or not TIKTOKEN_AVAILABLE:
+        return encoding
+    failed_at = _failed_at.get(model)
+    if failed_at is not None and time.monotonic() - failed_at < ENCODING_RETRY_INTERVAL:
+        return None
+    try:
+        return get_encoding(model)
+    except Exception as e:
+        _failed_at[model] = time.monotonic()
+        logger.warning(f"tiktoken encoding for {model} not loaded, using approximate counts: {e}")
+        return None
+
+
+def count_tokens(text, model="gpt-4"):
+    encoding = _encoding_or_none(model)
+    if encoding is None:
+        # Для русского текста примерно 2.5 символа на токен
+        return int(len(text) / 2.5) + 1
+    return len(encoding.encode(text, disallowed_special=()))
@@ -0,0 +1,125 @@
+"""Local off-topic classifier that answers obvious non-Constitution questions"""
+import os
+import re
+import json
+import math
+import logging
+from collections import Counter
+from functools import lru_cache
+
+from backend.corpus import get_constitution
+from backend.retrieval import get_retriever
+
+logger = logging.getLogger(__name__)
+
+TOPIC_EXAMPLES_PATH = os.path.join(os.path.dirname(__file__), "data", "topic_examples.json")
+
+OFFTOPIC_ENABLED = os.environ.get("OFFTOPIC_ENABLED", "1") == "1"
+# Отказ без запроса к модели только при высокой уверенности
+OFFTOPIC_THRESHOLD = float(os.environ.get("OFFTOPIC_THRESHOLD", 0.9))
+
+NGRAM_SIZES = (3, 4, 5)
+# Статьи Конституции длиннее вопросов: их n-граммы берутся с меньшим весом
+CORPUS_WEIGHT = 0.1
+# Сглаживание и масштаб средней разности логарифмов при переводе в вероятность
+ALPHA = 0.5
+SCORE_SCALE = 8.0
+
+# Слова предметной области: с ними вопрос всегда уходит модели, даже при высоком score
+DOMAIN_PREFIXES = (
+    "конституц", "стать", "основн", "беларус", "белорус", "республик", "государств",
+    "гражд", "президент", "парламент", "депутат", "палат", "собрани", "правительств",
+    "министр", "премьер", "прокур", "суд", "референдум", "выбор", "избира", "голосов",
+    "власт", "полномоч", "свобод", "обязанн", "неприкосновен", "суверен", "алес",
+    "религ", "вероиспов", "церк",
+)
+
+OFFTOPIC_REFUSAL = (
+    "Меня зовут Алеся. Я могу отвечать только по Конституции Республики Беларусь. "
+    "Пожалуйста, задайте вопрос о Конституции."
+)
+
+_WORD_RE = re.compile(r"[а-яa-z0-9]+")
+
+
+def char_ngrams(text):
+    """Character n-grams of each word padded with spaces"""
+    text = text.lower().replace("ё", "е")
+    grams = []
+    for word in _WORD_RE.findall(text):
+        padded = f" {word} "
+        for n in NGRAM_SIZES:
+            grams.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+    return grams
+
+
+class TopicClassifier:
+    """Two-class multinomial naive Bayes over character n-grams.
+
+    Weights are stored as one log-likelihood ratio per n-gram, so scoring a
+    message is a dictionary lookup per n-gram; unseen n-grams are ignored.
+    """
+
+    def __init__(self, on_topic, off_topic, threshold=OFFTOPIC_THRESHOLD):
+        self.threshold = threshold
+        on_counts = Counter()
+        off_counts = Counter()
+        for text, weight in on_topic:
+            for gram in char_ngrams(text):
+                on_counts[gram] += weight
+        for text in off_topic:
+            off_counts.update(char_ngrams(text))
+
+        vocabulary = on_counts.keys() | off_counts.keys()
+        on_total = sum(on_counts.values()) + ALPHA * len(vocabulary)
+        off_total = sum(off_counts.values()) + ALPHA * len(vocabulary)
+        self.weights = {
+            gram: math.log((off_counts[gram] + ALPHA) / off_total)
+            - math.log((on_counts[gram] + ALPHA) / on_total)
+            for gram in vocabulary
+        }
+
+    @classmethod
+    def load(cls, path=TOPIC_EXAMPLES_PATH):
+        with open(path, encoding="utf-8") as f:
+            examples = json.load(f)
+        on_topic = [(text, 1.0) for text in examples["on_topic"]]
+        titles = set()
+        for article in get_constitution().articles.values():
+            on_topic.extend((paragraph, CORPUS_WEIGHT) for paragraph in article.paragraphs)
+            titles.update(t for t in (article.section_title, article.chapter_title) if t)
+        on_topic.extend((title, 1.0) for title in sorted(titles))
+        return cls(on_topic, examples["off_topic"])
+
+    def score(self, text):
+        """Probability in [0, 1] that the message is off-topic"""
+        weights = [self.weights[g] for g in char_ngrams(text) if g in self.weights]
+        if not weights:
+            return 0.0
+        mean = sum(weights) / len(weights)
+        return 1.0 / (1.0 + math.exp(-SCORE_SCALE * mean))
+
+    def is_off_topic(self, text):
+        """Return (decision, score).
+
+        A confident score alone is not enough: the message is refused only
+        when it has no domain words and BM25 finds no matching article.
+        """
+        score = self.score(text)
+        if score < self.threshold:
+            return False, score
+        words = _WORD_RE.findall(text.lower().replace("ё", "е"))
+        if any(word.startswith(DOMAIN_PREFIXES) for word in words):
+            return False, score
+        # Короткие вопросы ("какой герб", "сколько длится отпуск") классификатор
+        # путает с бытовыми; найденная статья важнее его оценки
+        if get_retriever().search(text):
+            return False, score
+        return True, score
+
+
+@lru_cache(maxsize=1)
+def get_topic_classifier():
+    classifier = TopicClassifier.load()
+    logger.info(f"Off-topic classifier ready: {len(classifier.weights)} n-grams")
+    return classifier
@@ -0,0 +1,270 @@
+"""Speech-to-text with a local Whisper model in a dedicated process pool"""
+import os
+import time
+import shutil
+import asyncio
+import logging
+import subprocess
+import importlib.util
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from backend.scheduler import QueueFullError
+
+logger = logging.getLogger(__name__)
+
+# whisper тянет torch - в основном процессе только проверяем наличие пакета
+WHISPER_AVAILABLE = importlib.util.find_spec("whisper") is not None
+# Без ffmpeg читаются только WAV 16 кГц и сырой PCM16; webm/ogg/mp3 - нет
+FFMPEG_AVAILABLE = shutil.which("ffmpeg") is not None
+if not FFMPEG_AVAILABLE:
+    logger.warning("ffmpeg not found, only 16 kHz WAV and raw PCM16 audio can be transcribed")
+
+TRANSCRIBE_ENABLED = os.environ.get("TRANSCRIBE_ENABLED", "1") == "1"
+WHISPER_MODEL = os.environ.get("WHISPER_MODEL", "base")
+TRANSCRIBE_LANGUAGE = os.environ.get("TRANSCRIBE_LANGUAGE", "ru")
+TRANSCRIBE_WORKERS = int(os.environ.get("TRANSCRIBE_WORKERS", 1))
+TRANSCRIBE_THREADS = int(os.environ.get("TRANSCRIBE_THREADS", 2))
+TRANSCRIBE_BATCH_SIZE = int(os.environ.get("TRANSCRIBE_BATCH_SIZE", 4))
+TRANSCRIBE_BATCH_WAIT = float(os.environ.get("TRANSCRIBE_BATCH_WAIT", 0.05))
+TRANSCRIBE_MAX_QUEUE = int(os.environ.get("TRANSCRIBE_MAX_QUEUE", 64))
+TRANSCRIBE_MAX_BYTES = int(os.environ.get("TRANSCRIBE_MAX_BYTES", 25 * 1024 * 1024))
+
+SAMPLE_RATE = 16000
+# Клипы не длиннее окна Whisper (30 с) декодируются одной пачкой
+BATCH_MAX_SAMPLES = 30 * SAMPLE_RATE
+
+
+class TranscriptionError(Exception):
+    pass
+
+
+class DecoderUnavailableError(TranscriptionError):
+    """The clip needs ffmpeg, which is not installed"""
+
+
+def decode_audio(data):
+    """Decode any container ffmpeg understands to mono 16 kHz float32, via pipes"""
+    import numpy as np
+
+    try:
+        process = subprocess.run(
+            ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", "pipe:0",
+             "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1"],
+            input=data, capture_output=True
+        )
+    except FileNotFoundError:
+        raise DecoderUnavailableError("ffmpeg is not installed")
+    if process.returncode != 0:
+        raise TranscriptionError(f"ffmpeg failed: {process.stderr.decode(errors='replace').strip()}")
+    return np.frombuffer(process.stdout, np.int16).astype(np.float32) / 32768.0
+
+
+# --- код ниже выполняется в процессах пула ---
+
+_model = None
+
+
+def _init_worker(model_name, threads):
+    """Load the model once per worker process"""
+    global _model
+    import torch
+    import whisper
+
+    torch.set_num_threads(threads)
+    _model = whisper.load_model(model_name, device="cpu")
+
+
+def _warmup():
+    return os.getpid()
+
+
+def _transcribe_batch(clips, language):
+    """Transcribe a list of clips; returns (started_at, decode_s, results).
+
+    A clip is either encoded audio bytes or an already decoded float32
+    array at 16 kHz. Each result is (text, None) or (None, error message),
+    so one broken clip does not fail the whole batch.
+    """
+    import numpy as np
+    import whisper
+
+    started_at = time.time()
+    started = time.perf_counter()
+    results = [None] * len(clips)
+    short = []
+    for i, data in enumerate(clips):
+        try:
+            audio = data if isinstance(data, np.ndarray) else decode_audio(data)
+        except Exception as e:
+            results[i] = (None, str(e))
+            continue
+        if len(audio) <= BATCH_MAX_SAMPLES:
+            short.append((i, audio))
+        else:
+            text = _model.transcribe(audio, language=language, fp16=False)["text"]
+            results[i] = (text.strip(), None)
+
+    if short:
+        # Короткие клипы - одним прогоном декодера по батчу мел-спектрограмм
+        import torch
+
+        mels = torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), _model.dims.n_mels)
+            for _, audio in short
+        ])
+        options = whisper.DecodingOptions(language=language, fp16=False, without_timestamps=True)
+        decoded = whisper.decode(_model, mels, options)
+        for (i, _), result in zip(short, decoded):
+            results[i] = (result.text.strip(), None)
+
+    return started_at, time.perf_counter() - started, results
+
+
+# --- основной процесс ---
+
+class WhisperTranscriber:
+    """Queue clips, group them into batches and run them on the worker pool.
+
+    At most `workers` batches are in the pool at once; everything else waits
+    in our queue, where concurrent clips can still be merged into a batch.
+    """
+
+    def __init__(self, model_name=WHISPER_MODEL, workers=TRANSCRIBE_WORKERS, threads=TRANSCRIBE_THREADS,
+                 batch_size=TRANSCRIBE_BATCH_SIZE, batch_wait=TRANSCRIBE_BATCH_WAIT,
+                 max_queue=TRANSCRIBE_MAX_QUEUE, language=TRANSCRIBE_LANGUAGE):
+        self.model_name = model_name
+        self.workers = workers
+        self.threads = threads
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.max_queue = max_queue
+        self.language = language
+        self._executor = None
+        self._queue = None
+        self._task = None
+        self._slots = None
+        self.requests = 0
+        self.batches = 0
+        self.failures = 0
+        self.rejected = 0
+        self._last_decode_s = 1.0
+
+    async def start(self):
+        if self._executor is not None:
+            return
+        # spawn: torch в форкнутом процессе с потоками uvicorn ведет себя ненадежно
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.model_name, self.threads),
+        )
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.workers)
+        self._task = asyncio.create_task(self._run())
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        # Загружаем модель во всех воркерах до первого запроса
+        await asyncio.gather(*(loop.run_in_executor(self._executor, _warmup) for _ in range(self.workers)))
+        logger.info(
+            f"Whisper '{self.model_name}' ready in {self.workers} worker(s) "
+            f"in {round(time.perf_counter() - started, 1)} s"
+        )
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    @property
+    def ready(self):
+        """Workers are up; compressed formats additionally need `decodes_compressed`"""
+        return self._executor is not None
+
+    @property
+    def decodes_compressed(self):
+        return self.ready and FFMPEG_AVAILABLE
+
+    async def transcribe(self, data, timings=None):
+        """Return the transcribed text of encoded bytes or a float32 array;
+        fills queue wait and decode time into `timings`"""
+        if self._queue.qsize() >= self.max_queue:
+            self.rejected += 1
+            backlog = self._queue.qsize() / (self.batch_size * self.workers)
+            raise QueueFullError("Transcription queue is full", max(1, int(backlog * self._last_decode_s + 0.999)))
+        self.requests += 1
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((data, time.time(), future, timings))
+        return await future
+
+    async def _next_batch(self):
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        in_flight = set()
+        while True:
+            # Сначала свободный воркер, потом пачка: пока воркеры заняты, очередь копится
+            await self._slots.acquire()
+            batch = await self._next_batch()
+            task = asyncio.create_task(self._process(batch))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+            task.add_done_callback(lambda _: self._slots.release())
+
+    async def _process(self, batch):
+        loop = asyncio.get_running_loop()
+        clips = [item[0] for item in batch]
+        try:
+            started_at, decode_s, results = await loop.run_in_executor(
+                self._executor, _transcribe_batch, clips, self.language
+            )
+        except Exception as e:
+            self.failures += len(batch)
+            logger.error(f"Transcription batch of {len(batch)} failed: {e}")
+            for _, _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(TranscriptionError(str(e)))
+            return
+
+        self.batches += 1
+        self._last_decode_s = decode_s
+        for (_, enqueued_at, future, timings), (text, error) in zip(batch, results):
+            if timings is not None:
+                timings["transcribe_queue_ms"] = round(max(0.0, started_at - enqueued_at) * 1000, 1)
+                timings["transcribe_decode_ms"] = round(decode_s * 1000, 1)
+                timings["transcribe_batch"] = len(batch)
+            if future.done():
+                continue
+            if error is not None:
+                self.failures += 1
+                future.set_exception(TranscriptionError(error))
+            else:
+                future.set_result(text)
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "ffmpeg": FFMPEG_AVAILABLE,
+            "model": self.model_name,
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "requests": self.requests,
+            "batches": self.batches,
+            "failures": self.failures,
+            "rejected": self.rejected,
+        }
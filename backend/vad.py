@@ -0,0 +1,94 @@
+"""Energy-based voice activity detection for streamed PCM audio"""
+import os
+from collections import deque
+
+import numpy as np
+
+VAD_FRAME_MS = int(os.environ.get("VAD_FRAME_MS", 30))
+# Абсолютный порог и запас над оценкой шума, дБ относительно полной шкалы
+VAD_THRESHOLD_DB = float(os.environ.get("VAD_THRESHOLD_DB", -45))
+VAD_MARGIN_DB = float(os.environ.get("VAD_MARGIN_DB", 10))
+VAD_START_MS = int(os.environ.get("VAD_START_MS", 90))
+VAD_HANGOVER_MS = int(os.environ.get("VAD_HANGOVER_MS", 500))
+VAD_PREROLL_MS = int(os.environ.get("VAD_PREROLL_MS", 200))
+VAD_MAX_SEGMENT_S = float(os.environ.get("VAD_MAX_SEGMENT_S", 30))
+
+
+class SpeechSegmenter:
+    """Split a stream of float32 samples into speech segments.
+
+    A frame is voiced when its energy exceeds both an absolute threshold and
+    the running noise floor by `margin_db`. Speech starts after `start_ms` of
+    consecutive voiced frames (keeping `preroll_ms` before it) and ends after
+    `hangover_ms` of silence or at `max_segment_s`.
+    """
+
+    def __init__(self, sample_rate=16000, frame_ms=VAD_FRAME_MS, threshold_db=VAD_THRESHOLD_DB,
+                 margin_db=VAD_MARGIN_DB, start_ms=VAD_START_MS, hangover_ms=VAD_HANGOVER_MS,
+                 preroll_ms=VAD_PREROLL_MS, max_segment_s=VAD_MAX_SEGMENT_S):
+        self.sample_rate = sample_rate
+        self.frame = sample_rate * frame_ms // 1000
+        self.threshold_db = threshold_db
+        self.margin_db = margin_db
+        self.start_frames = max(1, start_ms // frame_ms)
+        self.hangover_frames = max(1, hangover_ms // frame_ms)
+        self.max_frames = int(max_segment_s * 1000 // frame_ms)
+        self.noise_db = -60.0
+        self.in_speech = False
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._preroll = deque(maxlen=max(self.start_frames, preroll_ms // frame_ms))
+        self._segment = []
+        self._voiced_run = 0
+        self._silence_run = 0
+
+    def feed(self, samples):
+        """Consume samples; return the list of segments that ended in them"""
+        if len(self._pending):
+            samples = np.concatenate((self._pending, samples))
+        usable = len(samples) - len(samples) % self.frame
+        self._pending = samples[usable:].copy()
+        if not usable:
+            return []
+        frames = samples[:usable].reshape(-1, self.frame)
+        # Энергия всех кадров одним векторным вычислением
+        energies = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+
+        finished = []
+        for frame, energy in zip(frames, energies):
+            voiced = energy > max(self.threshold_db, self.noise_db + self.margin_db)
+            if not self.in_speech:
+                self.noise_db = 0.95 * self.noise_db + 0.05 * min(energy, self.noise_db + self.margin_db)
+                self._preroll.append(frame)
+                self._voiced_run = self._voiced_run + 1 if voiced else 0
+                if self._voiced_run >= self.start_frames:
+                    self.in_speech = True
+                    self._segment = list(self._preroll)
+                    self._preroll.clear()
+                    self._silence_run = 0
+                continue
+
+            self._segment.append(frame)
+            self._silence_run = 0 if voiced else self._silence_run + 1
+            if self._silence_run >= self.hangover_frames or len(self._segment) >= self.max_frames:
+                finished.append(self._finish())
+        return finished
+
+    def current(self):
+        """Audio of the segment in progress, or None outside speech"""
+        if not self.in_speech or not self._segment:
+            return None
+        return np.concatenate(self._segment)
+
+    def flush(self):
+        """End of stream: return the unfinished segment, if any"""
+        return self._finish() if self.in_speech and self._segment else None
+
+    def _finish(self):
+        # Хвост тишины после речи Whisper не нужен - оставляем немного
+        keep = len(self._segment) - max(0, self._silence_run - self.start_frames)
+        audio = np.concatenate(self._segment[:keep])
+        self.in_speech = False
+        self._segment = []
+        self._voiced_run = 0
+        self._silence_run = 0
+        return audio
@@ -0,0 +1,120 @@
+"""Pool of pre-created realtime voice sessions"""
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+VOICE_POOL_SIZE = int(os.environ.get("VOICE_POOL_SIZE", 2))
+# Сессия с меньшим остатком жизни клиенту не выдается (секунды)
+VOICE_POOL_MIN_TTL = float(os.environ.get("VOICE_POOL_MIN_TTL", 20))
+# Без спроса дольше этого пул перестает пополняться
+VOICE_POOL_IDLE_TIMEOUT = float(os.environ.get("VOICE_POOL_IDLE_TIMEOUT", 900))
+VOICE_POOL_RETRY_DELAY = float(os.environ.get("VOICE_POOL_RETRY_DELAY", 5))
+
+
+class RealtimeSessionPool:
+    """Keep up to `size` ready ephemeral sessions and hand them out instantly.
+
+    `create` is an async callable returning a session dict with
+    `client_secret.expires_at` (unix seconds). A background task refills the
+    pool after each checkout and replaces sessions before they get within
+    `min_ttl` of expiry. Refilling pauses after `idle_timeout` seconds
+    without demand, so an idle deployment does not keep minting sessions.
+    """
+
+    def __init__(self, create, size=VOICE_POOL_SIZE, min_ttl=VOICE_POOL_MIN_TTL,
+                 idle_timeout=VOICE_POOL_IDLE_TIMEOUT):
+        self.create = create
+        self.size = size
+        self.min_ttl = min_ttl
+        self.idle_timeout = idle_timeout
+        self._sessions = deque()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._last_demand = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.created = 0
+        self.discarded = 0
+        self.failures = 0
+
+    def start(self):
+        if self._task is None and self.size > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _fresh(self, session, now=None):
+        now = time.time() if now is None else now
+        return session["client_secret"]["expires_at"] - now >= self.min_ttl
+
+    def _discard_stale(self):
+        now = time.time()
+        fresh = [s for s in self._sessions if self._fresh(s, now)]
+        self.discarded += len(self._sessions) - len(fresh)
+        self._sessions = deque(fresh)
+
+    def acquire(self):
+        """Return a ready session or None (pool miss); never waits upstream"""
+        self._last_demand = time.monotonic()
+        self._discard_stale()
+        self._wakeup.set()
+        if self._sessions:
+            self.hits += 1
+            return self._sessions.popleft()
+        self.misses += 1
+        return None
+
+    async def _fill(self):
+        missing = self.size - len(self._sessions)
+        if missing <= 0:
+            return
+        results = await asyncio.gather(*(self.create() for _ in range(missing)), return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                self.failures += 1
+                logger.warning(f"Voice pool refill failed: {result}")
+            elif self._fresh(result):
+                self._sessions.append(result)
+                self.created += 1
+        if any(isinstance(r, BaseException) for r in results):
+            await asyncio.sleep(VOICE_POOL_RETRY_DELAY)
+
+    def _next_deadline(self):
+        """Seconds until the first pooled session turns stale"""
+        if not self._sessions:
+            return self.idle_timeout
+        now = time.time()
+        soonest = min(s["client_secret"]["expires_at"] for s in self._sessions)
+        return max(0.0, soonest - self.min_ttl - now)
+
+    async def _run(self):
+        while True:
+            self._discard_stale()
+            if time.monotonic() - self._last_demand < self.idle_timeout:
+                await self._fill()
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._next_deadline() + 0.01)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self):
+        requests = self.hits + self.misses
+        return {
+            "ready": len(self._sessions),
+            "size": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / requests, 4) if requests else None,
+            "created": self.created,
+            "discarded": self.discarded,
+            "failures": self.failures,
+        }
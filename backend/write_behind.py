@@ -0,0 +1,127 @@
+"""Write-behind queue that batches message inserts off the request path"""
+import os
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+WRITE_BATCH_SIZE = int(os.environ.get("WRITE_BATCH_SIZE", 100))
+WRITE_FLUSH_INTERVAL = float(os.environ.get("WRITE_FLUSH_INTERVAL", 0.5))
+WRITE_QUEUE_SIZE = int(os.environ.get("WRITE_QUEUE_SIZE", 10000))
+WRITE_ENQUEUE_TIMEOUT = float(os.environ.get("WRITE_ENQUEUE_TIMEOUT", 2))
+
+_STOP = object()
+
+
+class WriteBehindQueue:
+    """Buffer documents in memory and hand them to `sink` in batches.
+
+    `sink` is an async callable taking a list of documents. A batch is
+    flushed when it reaches `batch_size` or `flush_interval` seconds after
+    its first document arrived. When the queue is full, `enqueue` waits for
+    space (back-pressure) up to `enqueue_timeout` before dropping the write.
+    """
+
+    def __init__(self, sink, batch_size=WRITE_BATCH_SIZE, flush_interval=WRITE_FLUSH_INTERVAL,
+                 max_queue=WRITE_QUEUE_SIZE, enqueue_timeout=WRITE_ENQUEUE_TIMEOUT):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self._queue = asyncio.Queue(maxsize=max_queue)
+        self._task = None
+        self.queued = 0
+        self.flushed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.batches = 0
+        self.last_flush_ms = 0.0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def enqueue(self, doc):
+        try:
+            self._queue.put_nowait(doc)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(self._queue.put(doc), self.enqueue_timeout)
+            except asyncio.TimeoutError:
+                self.dropped += 1
+                logger.error("Write-behind queue full, message dropped")
+                return False
+        self.queued += 1
+        return True
+
+    async def _next_batch(self):
+        """Return (batch, stop_requested)"""
+        first = await self._queue.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                doc = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if doc is _STOP:
+                return batch, True
+            batch.append(doc)
+        return batch, False
+
+    async def _flush(self, batch):
+        if not batch:
+            return
+        started = time.perf_counter()
+        try:
+            await self.sink(batch)
+            self.flushed += len(batch)
+            self.batches += 1
+        except Exception as e:
+            self.failed += len(batch)
+            logger.error(f"Write-behind flush of {len(batch)} messages failed: {e}")
+        self.last_flush_ms = round((time.perf_counter() - started) * 1000, 3)
+
+    async def _run(self):
+        while True:
+            batch, stop = await self._next_batch()
+            await self._flush(batch)
+            if stop:
+                break
+        # Дописываем все, что успело попасть в очередь до остановки
+        pending = []
+        while not self._queue.empty():
+            doc = self._queue.get_nowait()
+            if doc is not _STOP:
+                pending.append(doc)
+        for i in range(0, len(pending), self.batch_size):
+            await self._flush(pending[i:i + self.batch_size])
+
+    async def stop(self):
+        """Flush everything still queued and stop the flush loop"""
+        if self._task is None:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+        logger.info(f"Write-behind queue stopped: {self.stats()}")
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        return {
+            "depth": self.depth(),
+            "queued": self.queued,
+            "flushed": self.flushed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "last_flush_ms": self.last_flush_ms,
+        }
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Load-testing benchmark for the Belarus Constitution AI Assistant.
+
+Drives /api/chat, /api/chat/stream and /api/voice/realtime/session either
+with a fixed number of concurrent clients (closed loop) or at a fixed
+arrival rate (open loop, Poisson arrivals). Reports p50/p95/p99 latency,
+time to first SSE delta, throughput and error rates, writes the results
+as JSON and compares them with a stored baseline.
+
+Run the backend against the local stand-in first:
+    python fake_openai_server.py --port 9000 --seed 1
+    OPENAI_BASE_URL=http://localhost:9000/v1 OPENAI_API_KEY=fake uvicorn backend.server:app --port 8001
+
+Then:
+    python benchmark.py --scenario mixed --concurrency 32 --duration 30 --output results.json
+    python benchmark.py --rate 50 --duration 30 --baseline results.json
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import platform
+
+import httpx
+
+BACKEND_URL = os.environ.get("BENCHMARK_BACKEND_URL", "http://localhost:8001")
+
+# Вопросы из существующих тестовых сценариев
+QUESTIONS = [
+    "Какие права граждан гарантирует Конституция Беларуси?",
+    "Расскажи о структуре власти по Конституции",
+    "Что говорит Конституция о правах человека?",
+    "Какие обязанности граждан установлены Конституцией?",
+    "Что сказано в Конституции о государственном языке?",
+    "Какие полномочия у Президента Республики Беларусь?",
+    "Как избирается Парламент?",
+    "Что такое Всебелорусское народное собрание?",
+    "Статья 21",
+    "Какая погода сегодня?",
+]
+
+# Доли сценариев в смешанной нагрузке
+MIXED_WEIGHTS = {"chat": 0.3, "stream": 0.6, "voice": 0.1}
+
+# Допуски при сравнении с эталоном
+DEFAULT_TOLERANCE = 0.15
+ERROR_RATE_TOLERANCE = 0.01
+
+
+class Recorder:
+    """Raw samples of one scenario"""
+
+    def __init__(self):
+        self.latencies = []
+        self.ttfb = []
+        self.statuses = {}
+        self.errors = 0
+
+    def record(self, status, latency, ttfb=None, ok=True):
+        self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+        if ok:
+            self.latencies.append(latency)
+            if ttfb is not None:
+                self.ttfb.append(ttfb)
+        else:
+            self.errors += 1
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def summarize(values):
+    if not values:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "mean_ms": None, "max_ms": None}
+    return {
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+        "mean_ms": round(sum(values) / len(values) * 1000, 2),
+        "max_ms": round(max(values) * 1000, 2),
+    }
+
+
+def question_for(args, rng):
+    question = rng.choice(QUESTIONS)
+    if args.unique:
+        # Уникальный хвост обходит кэш ответов и объединение запросов
+        question = f"{question} ({uuid.uuid4().hex[:8]})"
+    return question
+
+
+async def run_chat(client, args, rng, recorder):
+    payload = {"message": question_for(args, rng), "session_id": str(uuid.uuid4())}
+    started = time.perf_counter()
+    try:
+        response = await client.post("/api/chat", json=payload)
+        ok = response.status_code == 200 and "response" in response.json()
+        recorder.record(response.status_code, time.perf_counter() - started, ok=ok)
+    except httpx.HTTPError as e:
+        recorder.record(type(e).__name__, time.perf_counter() - started, ok=False)
+
+
+async def run_stream(client, args, rng, recorder):
+    payload = {"message": question_for(args, rng), "session_id": str(uuid.uuid4())}
+    started = time.perf_counter()
+    ttfb = None
+    ok = False
+    status = None
+    try:
+        async with client.stream("POST", "/api/chat/stream", json=payload) as response:
+            status = response.status_code
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                event = json.loads(line[6:])
+                if "error" in event:
+                    break
+                if ttfb is None and event.get("delta"):
+                    ttfb = time.perf_counter() - started
+                if event.get("done"):
+                    ok = status == 200
+                    break
+        recorder.record(status, time.perf_counter() - started, ttfb=ttfb, ok=ok)
+    except httpx.HTTPError as e:
+        recorder.record(type(e).__name__, time.perf_counter() - started, ok=False)
+
+
+async def run_voice(client, args, rng, recorder):
+    started = time.perf_counter()
+    try:
+        response = await client.post("/api/voice/realtime/session")
+        ok = response.status_code == 200
+        recorder.record(response.status_code, time.perf_counter() - started, ok=ok)
+    except httpx.HTTPError as e:
+        recorder.record(type(e).__name__, time.perf_counter() - started, ok=False)
+
+
+SCENARIOS = {"chat": run_chat, "stream": run_stream, "voice": run_voice}
+
+
+def pick_scenario(args, rng):
+    if args.scenario != "mixed":
+        return args.scenario
+    return rng.choices(list(MIXED_WEIGHTS), weights=list(MIXED_WEIGHTS.values()))[0]
+
+
+async def closed_loop(client, args, rng, recorders, deadline, budget):
+    """`concurrency` clients, each sending the next request as soon as one finishes"""
+    async def worker():
+        while time.perf_counter() < deadline and budget.take():
+            name = pick_scenario(args, rng)
+            await SCENARIOS[name](client, args, rng, recorders[name])
+
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+
+
+async def open_loop(client, args, rng, recorders, deadline, budget):
+    """Poisson arrivals at `rate` per second regardless of response times"""
+    tasks = set()
+    next_arrival = time.perf_counter()
+    while time.perf_counter() < deadline and budget.take():
+        delay = next_arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        name = pick_scenario(args, rng)
+        task = asyncio.create_task(SCENARIOS[name](client, args, rng, recorders[name]))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        next_arrival += rng.expovariate(args.rate)
+    if tasks:
+        await asyncio.gather(*tasks)
+
+
+class RequestBudget:
+    def __init__(self, limit):
+        self.remaining = limit
+
+    def take(self):
+        if self.remaining is None:
+            return True
+        if self.remaining <= 0:
+            return False
+        self.remaining -= 1
+        return True
+
+
+async def run_benchmark(args):
+    rng = random.Random(args.seed)
+    recorders = {name: Recorder() for name in SCENARIOS}
+    limits = httpx.Limits(max_connections=max(args.concurrency, 100), max_keepalive_connections=max(args.concurrency, 100))
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+        # Прогрев: первые запросы платят за соединения и холодные кэши
+        for _ in range(args.warmup):
+            name = pick_scenario(args, rng)
+            await SCENARIOS[name](client, args, rng, Recorder())
+
+        budget = RequestBudget(args.requests)
+        started = time.perf_counter()
+        deadline = started + args.duration
+        if args.rate:
+            await open_loop(client, args, rng, recorders, deadline, budget)
+        else:
+            await closed_loop(client, args, rng, recorders, deadline, budget)
+        elapsed = time.perf_counter() - started
+
+    scenarios = {}
+    for name, recorder in recorders.items():
+        total = len(recorder.latencies) + recorder.errors
+        if not total:
+            continue
+        scenarios[name] = {
+            "requests": total,
+            "errors": recorder.errors,
+            "error_rate": round(recorder.errors / total, 4),
+            "throughput_rps": round(len(recorder.latencies) / elapsed, 2),
+            "statuses": recorder.statuses,
+            "latency": summarize(recorder.latencies),
+        }
+        if recorder.ttfb:
+            scenarios[name]["ttfb"] = summarize(recorder.ttfb)
+
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "target": args.url,
+        "config": {
+            "scenario": args.scenario,
+            "mode": "open" if args.rate else "closed",
+            "concurrency": args.concurrency,
+            "rate": args.rate,
+            "duration": args.duration,
+            "requests": args.requests,
+            "unique": args.unique,
+            "seed": args.seed,
+        },
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "elapsed_s": round(elapsed, 3),
+        "scenarios": scenarios,
+    }
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """Return a list of human-readable regressions"""
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            continue
+        for section in ("latency", "ttfb"):
+            for metric in ("p50_ms", "p95_ms", "p99_ms"):
+                old = previous.get(section, {}).get(metric)
+                new = current.get(section, {}).get(metric)
+                if old and new and new > old * (1 + tolerance):
+                    regressions.append(f"{name} {section} {metric}: {old} -> {new} (+{(new / old - 1) * 100:.1f}%)")
+        if current["error_rate"] > previous["error_rate"] + ERROR_RATE_TOLERANCE:
+            regressions.append(f"{name} error_rate: {previous['error_rate']} -> {current['error_rate']}")
+        # В открытом цикле пропускная способность задана частотой запросов
+        old_rps = previous.get("throughput_rps")
+        closed = results["config"]["mode"] == baseline.get("config", {}).get("mode") == "closed"
+        if closed and old_rps and current["throughput_rps"] < old_rps * (1 - tolerance):
+            regressions.append(f"{name} throughput_rps: {old_rps} -> {current['throughput_rps']}")
+    return regressions
+
+
+def format_ms(value):
+    return "-" if value is None else f"{value}ms"
+
+
+def print_report(results):
+    config = results["config"]
+    print(f"\n📊 {config['scenario']} / {config['mode']} loop against {results['target']} in {results['elapsed_s']}s")
+    for name, scenario in results["scenarios"].items():
+        latency = scenario["latency"]
+        print(
+            f"  {name:7s} n={scenario['requests']:<6d} rps={scenario['throughput_rps']:<8} "
+            f"errors={scenario['error_rate'] * 100:.2f}%  "
+            f"p50={format_ms(latency['p50_ms'])} p95={format_ms(latency['p95_ms'])} p99={format_ms(latency['p99_ms'])}"
+        )
+        if "ttfb" in scenario:
+            ttfb = scenario["ttfb"]
+            print(f"  {'':7s} ttfb p50={format_ms(ttfb['p50_ms'])} p95={format_ms(ttfb['p95_ms'])} p99={format_ms(ttfb['p99_ms'])}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the chat and voice endpoints")
+    parser.add_argument("--url", default=BACKEND_URL)
+    parser.add_argument("--scenario", choices=("chat", "stream", "voice", "mixed"), default="mixed")
+    parser.add_argument("--concurrency", type=int, default=16, help="clients in closed-loop mode")
+    parser.add_argument("--rate", type=float, help="arrivals per second (open loop) instead of fixed concurrency")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run")
+    parser.add_argument("--requests", type=int, help="stop after this many requests")
+    parser.add_argument("--warmup", type=int, default=5, help="unrecorded requests before measuring")
+    parser.add_argument("--unique", action="store_true", help="make every question unique to bypass caches")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed relative slowdown before a metric counts as a regression")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = asyncio.run(run_benchmark(args))
+    print_report(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) against {args.baseline}:")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+        print(f"\n✅ No regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Fake OpenAI-compatible server for offline load testing.
+
+Implements the endpoints the backend calls: chat completions (plain and
+streaming), embeddings, realtime sessions and audio transcriptions.
+Latency, token rate and error injection are configurable, so performance
+runs are reproducible without network access or API costs.
+
+Usage:
+    python fake_openai_server.py --port 9000 --latency-ms 400 --tokens-per-sec 60
+    OPENAI_BASE_URL=http://localhost:9000/v1 OPENAI_API_KEY=fake uvicorn backend.server:app
+"""
+
+import os
+import json
+import time
+import uuid
+import zlib
+import random
+import asyncio
+import argparse
+
+from fastapi import FastAPI, Request, UploadFile, File, Form
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+class FakeConfig:
+    """Knobs of the fake upstream; defaults come from FAKE_* environment variables"""
+
+    def __init__(self):
+        # Распределение задержки до первого токена: constant | uniform | lognormal
+        self.latency_dist = os.environ.get("FAKE_LATENCY_DIST", "lognormal")
+        self.latency_ms = float(os.environ.get("FAKE_LATENCY_MS", 300))
+        self.latency_jitter = float(os.environ.get("FAKE_LATENCY_JITTER", 0.5))
+        self.tokens_per_sec = float(os.environ.get("FAKE_TOKENS_PER_SEC", 50))
+        self.error_rate = float(os.environ.get("FAKE_ERROR_RATE", 0))
+        self.error_status = int(os.environ.get("FAKE_ERROR_STATUS", 500))
+        self.answer_tokens = int(os.environ.get("FAKE_ANSWER_TOKENS", 120))
+        self.seed = os.environ.get("FAKE_SEED")
+
+    def apply_args(self, args):
+        for name in ("latency_dist", "latency_ms", "latency_jitter", "tokens_per_sec",
+                     "error_rate", "error_status", "answer_tokens", "seed"):
+            value = getattr(args, name)
+            if value is not None:
+                setattr(self, name, value)
+
+
+config = FakeConfig()
+rng = random.Random()
+
+ANSWER_WORDS = (
+    "Согласно Конституции Республики Беларусь, государство гарантирует права и свободы "
+    "граждан, закрепленные в Основном Законе. Статья 21 устанавливает, что обеспечение "
+    "прав и свобод граждан является высшей целью государства. Каждый имеет право на "
+    "достойный уровень жизни, включая достаточное питание, одежду, жилье и постоянное "
+    "улучшение необходимых для этого условий."
+).split()
+
+TRANSCRIPTION_TEXT = "Какие права гарантирует Конституция Республики Беларусь?"
+
+app = FastAPI(title="Fake OpenAI API")
+stats = {"requests": 0, "errors": 0, "streams": 0}
+
+
+def first_token_delay():
+    base = config.latency_ms / 1000
+    if config.latency_dist == "constant":
+        return base
+    if config.latency_dist == "uniform":
+        return rng.uniform(base * (1 - config.latency_jitter), base * (1 + config.latency_jitter))
+    # lognormal с медианой latency_ms: длинный хвост, как у настоящего API
+    return rng.lognormvariate(0, config.latency_jitter) * base
+
+
+def injected_error():
+    """OpenAI-style error response, or None when this request should succeed"""
+    if config.error_rate <= 0 or rng.random() >= config.error_rate:
+        return None
+    stats["errors"] += 1
+    status = config.error_status
+    kind = "rate_limit_exceeded" if status == 429 else "server_error"
+    headers = {"retry-after": "1"} if status == 429 else None
+    return JSONResponse(
+        status_code=status,
+        content={"error": {"message": f"Injected {status} error", "type": kind, "code": kind}},
+        headers=headers
+    )
+
+
+def answer_tokens(max_tokens):
+    count = min(config.answer_tokens, max_tokens or config.answer_tokens)
+    return [
+        (" " if i else "") + ANSWER_WORDS[i % len(ANSWER_WORDS)]
+        for i in range(count)
+    ]
+
+
+def prompt_tokens(messages):
+    # Грубая оценка: около 2.5 символа на токен для русского текста
+    return sum(len(str(m.get("content", ""))) for m in messages) * 2 // 5 + 4 * len(messages)
+
+
+def usage(messages, completion):
+    prompt = prompt_tokens(messages)
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    stats["requests"] += 1
+    body = await request.json()
+    error = injected_error()
+    if error is not None:
+        return error
+
+    model = body.get("model", "gpt-4")
+    messages = body.get("messages", [])
+    tokens = answer_tokens(body.get("max_tokens"))
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    created = int(time.time())
+    await asyncio.sleep(first_token_delay())
+
+    if not body.get("stream"):
+        # Без стриминга ответ приходит целиком после генерации всех токенов
+        await asyncio.sleep(len(tokens) / config.tokens_per_sec)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(tokens)},
+                "finish_reason": "stop"
+            }],
+            "usage": usage(messages, len(tokens))
+        }
+
+    stats["streams"] += 1
+    include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+    def chunk(delta, finish_reason=None):
+        return {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+
+    async def event_stream():
+        yield f"data: {json.dumps(chunk({'role': 'assistant', 'content': ''}), ensure_ascii=False)}\n\n"
+        interval = 1 / config.tokens_per_sec
+        for token in tokens:
+            yield f"data: {json.dumps(chunk({'content': token}), ensure_ascii=False)}\n\n"
+            await asyncio.sleep(interval)
+        yield f"data: {json.dumps(chunk({}, 'stop'))}\n\n"
+        if include_usage:
+            final = {**chunk({}), "choices": [], "usage": usage(messages, len(tokens))}
+            yield f"data: {json.dumps(final)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
+def fake_embedding(text, dimensions):
+    # Детерминированный вектор: одинаковый текст - одинаковое представление
+    local = random.Random(zlib.crc32(text.encode("utf-8")))
+    vector = [local.gauss(0, 1) for _ in range(dimensions)]
+    norm = sum(v * v for v in vector) ** 0.5 or 1.0
+    return [v / norm for v in vector]
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    stats["requests"] += 1
+    body = await request.json()
+    error = injected_error()
+    if error is not None:
+        return error
+    inputs = body.get("input", [])
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    dimensions = int(body.get("dimensions") or 1536)
+    await asyncio.sleep(first_token_delay() / 4)
+    total = sum(len(text) * 2 // 5 for text in inputs)
+    return {
+        "object": "list",
+        "model": body.get("model", "text-embedding-3-small"),
+        "data": [
+            {"object": "embedding", "index": i, "embedding": fake_embedding(text, dimensions)}
+            for i, text in enumerate(inputs)
+        ],
+        "usage": {"prompt_tokens": total, "total_tokens": total}
+    }
+
+
+@app.post("/v1/realtime/sessions")
+async def realtime_sessions(request: Request):
+    stats["requests"] += 1
+    body = await request.json()
+    error = injected_error()
+    if error is not None:
+        return error
+    await asyncio.sleep(first_token_delay())
+    return {
+        "id": f"sess_{uuid.uuid4().hex[:20]}",
+        "object": "realtime.session",
+        "model": body.get("model", "gpt-4o-realtime-preview-2024-12-17"),
+        "modalities": body.get("modalities", ["audio", "text"]),
+        "instructions": body.get("instructions", ""),
+        "voice": body.get("voice", "alloy"),
+        "input_audio_format": body.get("input_audio_format", "pcm16"),
+        "output_audio_format": body.get("output_audio_format", "pcm16"),
+        "client_secret": {
+            "value": f"ek_{uuid.uuid4().hex}",
+            "expires_at": int(time.time()) + 60
+        }
+    }
+
+
+@app.post("/v1/audio/transcriptions")
+async def audio_transcriptions(
+    file: UploadFile = File(...),
+    model: str = Form("whisper-1"),
+    response_format: str = Form("json")
+):
+    stats["requests"] += 1
+    error = injected_error()
+    if error is not None:
+        return error
+    audio = await file.read()
+    # Время распознавания растет с размером файла
+    await asyncio.sleep(first_token_delay() + len(audio) / 1_000_000)
+    if response_format == "text":
+        return StreamingResponse(iter([TRANSCRIPTION_TEXT]), media_type="text/plain")
+    return {"text": TRANSCRIPTION_TEXT}
+
+
+@app.get("/v1/models")
+async def models():
+    return {
+        "object": "list",
+        "data": [
+            {"id": name, "object": "model", "owned_by": "fake"}
+            for name in ("gpt-4", "gpt-4o-mini", "text-embedding-3-small", "whisper-1",
+                         "gpt-4o-realtime-preview-2024-12-17")
+        ]
+    }
+
+
+@app.get("/stats")
+async def get_stats():
+    return {**stats, "config": vars(config)}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("FAKE_OPENAI_PORT", 9000)))
+    parser.add_argument("--latency-dist", choices=("constant", "uniform", "lognormal"))
+    parser.add_argument("--latency-ms", type=float, help="median delay before the first token")
+    parser.add_argument("--latency-jitter", type=float, help="spread: uniform +-fraction or lognormal sigma")
+    parser.add_argument("--tokens-per-sec", type=float, help="streaming token rate")
+    parser.add_argument("--error-rate", type=float, help="fraction of requests that fail (0..1)")
+    parser.add_argument("--error-status", type=int, help="HTTP status of injected errors (429, 500, 503)")
+    parser.add_argument("--answer-tokens", type=int, help="tokens per completion")
+    parser.add_argument("--seed", help="random seed for reproducible runs")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    args = parse_args()
+    config.apply_args(args)
+    if config.seed is not None:
+        rng.seed(config.seed)
+    print(f"Fake OpenAI server on http://{args.host}:{args.port}/v1 ({vars(config)})")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
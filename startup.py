@@ -1,13 +1,58 @@
 #!/usr/bin/env python3
 import os
+import sys
+import time
+import subprocess
 import uvicorn
 
+# STARTUP_PROFILE=1 или --profile: время импорта модулей и фаз прогрева в лог
+STARTUP_PROFILE = os.environ.get("STARTUP_PROFILE") == "1" or "--profile" in sys.argv
+STARTUP_PROFILE_TOP = int(os.environ.get("STARTUP_PROFILE_TOP", 25))
+
+
+def import_profile(module="backend.server"):
+    """Per-module import times from `python -X importtime` in a fresh interpreter.
+
+    Returns (self_us, cumulative_us, name) rows sorted by cumulative time.
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True
+    )
+    rows = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(self_us), int(cumulative_us), name.strip()))
+    return sorted(rows, key=lambda row: row[1], reverse=True)
+
+
+def print_import_profile():
+    rows = import_profile()
+    if not rows:
+        print("Import profile unavailable")
+        return
+    print(f"Slowest imports (top {STARTUP_PROFILE_TOP} by cumulative time):")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for self_us, cumulative_us, name in rows[:STARTUP_PROFILE_TOP]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
+
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
     print(f"Starting server on port {port}")
-    
+
+    app = "backend.server:app"
+    if STARTUP_PROFILE:
+        print_import_profile()
+        started = time.perf_counter()
+        from backend.server import app
+        print(f"backend.server imported in {round((time.perf_counter() - started) * 1000, 1)} ms; "
+              f"warm-up phases are logged when /ready turns 200")
+
     uvicorn.run(
-        "backend.server:app",
+        app,
         host="0.0.0.0",
         port=port,
         log_level="warning"
@@ -0,0 +1,154 @@
+import io
+import wave
+import asyncio
+
+import numpy as np
+import pytest
+
+from backend.audio_ingest import (
+    AudioBuffer, AudioBufferPool, BodyTooLargeError,
+    multipart_boundary, find_multipart_file, _wav_pcm, decode_upload,
+)
+from backend.scheduler import QueueFullError
+
+BOUNDARY = b"----form7MA4YWxk"
+SIGNAL = (0.5 * np.sin(np.arange(1600) / 5)).astype(np.float32)
+
+
+def _buffer(data, limit=1024 * 1024):
+    buffer = AudioBuffer(limit, initial=64)
+    buffer.append(data)
+    return buffer
+
+
+def _multipart(*parts):
+    body = b""
+    for name, filename, content_type, payload in parts:
+        body += b"--" + BOUNDARY + b"\r\n"
+        disposition = f'Content-Disposition: form-data; name="{name}"'
+        if filename:
+            disposition += f'; filename="{filename}"'
+        body += disposition.encode() + b"\r\n"
+        if content_type:
+            body += f"Content-Type: {content_type}\r\n".encode()
+        body += b"\r\n" + payload + b"\r\n"
+    return body + b"--" + BOUNDARY + b"--\r\n"
+
+
+def _wav(samples, rate=16000, channels=1, float32=False):
+    if float32:
+        data = np.repeat(samples, channels).astype("<f4").tobytes()
+        fmt = (3).to_bytes(2, "little") + channels.to_bytes(2, "little") + rate.to_bytes(4, "little")
+        fmt += (rate * 4 * channels).to_bytes(4, "little") + (4 * channels).to_bytes(2, "little")
+        fmt += (32).to_bytes(2, "little")
+        chunks = b"fmt " + len(fmt).to_bytes(4, "little") + fmt
+        chunks += b"data" + len(data).to_bytes(4, "little") + data
+        return b"RIFF" + (4 + len(chunks)).to_bytes(4, "little") + b"WAVE" + chunks
+    out = io.BytesIO()
+    with wave.open(out, "wb") as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(np.repeat((samples * 32767).astype("<i2"), channels).tobytes())
+    return out.getvalue()
+
+
+def test_multipart_boundary_from_content_type():
+    assert multipart_boundary('multipart/form-data; boundary="abc"') == b"abc"
+    assert multipart_boundary("multipart/form-data; charset=utf-8; Boundary=xyz") == b"xyz"
+    assert multipart_boundary("multipart/form-data") is None
+
+
+def test_file_part_found_among_other_fields():
+    body = _multipart(
+        ("session_id", None, None, b"s1"),
+        ("file", "clip.webm", "audio/webm;codecs=opus", b"\x1aE\xdf\xa3 audio \r\n bytes"),
+        ("language", None, None, b"ru"),
+    )
+    buffer = _buffer(body)
+
+    start, end, content_type = find_multipart_file(buffer, BOUNDARY)
+
+    assert bytes(buffer.data[start:end]) == b"\x1aE\xdf\xa3 audio \r\n bytes"
+    assert content_type == "audio/webm;codecs=opus"
+
+
+def test_missing_file_part_returns_none():
+    body = _multipart(("audio", "clip.wav", "audio/wav", b"RIFF"))
+    assert find_multipart_file(_buffer(body), BOUNDARY) is None
+
+
+def test_truncated_body_returns_none():
+    body = _multipart(("file", "clip.wav", "audio/wav", b"x" * 100))
+    cut = body.index(b"x" * 100) + 50
+    assert find_multipart_file(_buffer(body[:cut]), BOUNDARY) is None
+    assert find_multipart_file(_buffer(body[:20]), BOUNDARY) is None
+
+
+def test_mono_pcm16_wav():
+    samples = _wav_pcm(memoryview(_wav(SIGNAL)))
+    assert samples.dtype == np.float32
+    assert len(samples) == len(SIGNAL)
+    np.testing.assert_allclose(samples, SIGNAL, atol=1e-4)
+
+
+def test_stereo_wav_is_downmixed():
+    samples = _wav_pcm(memoryview(_wav(SIGNAL, channels=2)))
+    assert len(samples) == len(SIGNAL)
+    np.testing.assert_allclose(samples, SIGNAL, atol=1e-4)
+
+
+def test_float32_wav():
+    samples = _wav_pcm(memoryview(_wav(SIGNAL, float32=True)))
+    np.testing.assert_array_equal(samples, SIGNAL)
+
+
+def test_other_sample_rates_fall_back_to_ffmpeg():
+    assert _wav_pcm(memoryview(_wav(SIGNAL, rate=44100))) is None
+    assert _wav_pcm(memoryview(_wav(SIGNAL, channels=3))) is None
+    assert _wav_pcm(memoryview(b"\x1aE\xdf\xa3 not a wav")) is None
+
+
+def test_truncated_wav_keeps_whole_samples():
+    data = _wav(SIGNAL)
+    samples = _wav_pcm(memoryview(data[:-3]))
+    assert len(samples) == len(SIGNAL) - 2
+
+
+def test_raw_pcm_upload_is_read_without_ffmpeg():
+    pcm = (SIGNAL * 32767).astype("<i2").tobytes()
+    samples = asyncio.run(decode_upload(memoryview(pcm), "audio/pcm"))
+    np.testing.assert_allclose(samples, SIGNAL, atol=1e-4)
+
+
+def test_body_over_limit_raises():
+    buffer = AudioBuffer(limit=100, initial=16)
+    buffer.append(b"x" * 60)
+    with pytest.raises(BodyTooLargeError):
+        buffer.append(b"x" * 41)
+    assert buffer.size == 60
+    assert len(buffer.data) <= 100
+
+
+def test_declared_length_over_limit_raises_before_reading():
+    class Request:
+        headers = {"content-length": "101"}
+
+        async def stream(self):
+            raise AssertionError("body must not be read")
+            yield b""
+
+    with pytest.raises(BodyTooLargeError):
+        asyncio.run(AudioBuffer(limit=100).read_from(Request()))
+
+
+def test_pool_reuses_buffers_and_rejects_when_exhausted():
+    pool = AudioBufferPool(count=1, limit=100)
+    buffer = pool.acquire()
+    buffer.append(b"abc")
+    with pytest.raises(QueueFullError):
+        pool.acquire()
+    pool.release(buffer)
+    again = pool.acquire()
+    assert again is buffer and again.size == 0
+    assert pool.stats()["rejected"] == 1
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from backend import server
+from backend.scheduler import LLMScheduler
+from backend.singleflight import StreamSingleFlight
+
+
+class FakeCompletion:
+    calls = 0
+
+    def __init__(self, client, **kwargs):
+        FakeCompletion.calls += 1
+        self.text = ""
+        self.usage = {"total_tokens": 2}
+
+    async def __aiter__(self):
+        for delta in ("Статья ", "19"):
+            self.text += delta
+            yield delta
+
+
+@pytest.fixture
+def stream_server(monkeypatch):
+    async def no_cached_answer(message, key, timings):
+        return None, None
+
+    async def persist(session_id, role, content):
+        pass
+
+    FakeCompletion.calls = 0
+    monkeypatch.setattr(server, "ChatCompletionStream", FakeCompletion)
+    monkeypatch.setattr(server, "stream_flights", StreamSingleFlight())
+    monkeypatch.setattr(server, "require_llm_client", lambda: object())
+    monkeypatch.setattr(server, "answer_from_faq", lambda message, timings: None)
+    monkeypatch.setattr(server, "refuse_off_topic", lambda message, timings: None)
+    monkeypatch.setattr(server, "find_cached_answer", no_cached_answer)
+    monkeypatch.setattr(server, "remember_answer", lambda *args: None)
+    monkeypatch.setattr(server, "persist_message", persist)
+    return server
+
+
+async def _ask(request):
+    try:
+        response = await server.chat_stream(request)
+    except HTTPException as e:
+        return e.status_code
+    return "".join([chunk async for chunk in response.body_iterator])
+
+
+def _requests(count):
+    return [server.ChatRequest(message="Какие символы у Беларуси?", session_id=f"s{i}") for i in range(count)]
+
+
+def test_identical_streams_share_one_queue_spot(stream_server, monkeypatch):
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=1)
+        monkeypatch.setattr(server, "llm_scheduler", scheduler)
+        await scheduler.acquire()
+        calls = [asyncio.ensure_future(_ask(request)) for request in _requests(20)]
+        for _ in range(5):
+            await asyncio.sleep(0)
+        queued = scheduler.queued
+        scheduler.release()
+        return queued, await asyncio.gather(*calls), scheduler
+
+    queued, results, scheduler = asyncio.run(scenario())
+    assert queued == 1
+    assert all(isinstance(body, str) and "Статья 19" in body for body in results)
+    assert FakeCompletion.calls == 1
+    assert scheduler.rejected == 0
+    assert (server.stream_flights.leaders, server.stream_flights.followers) == (1, 19)
+
+
+def test_rejected_leader_fails_every_follower(stream_server, monkeypatch):
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=0)
+        monkeypatch.setattr(server, "llm_scheduler", scheduler)
+        await scheduler.acquire()
+        return await asyncio.gather(*(_ask(request) for request in _requests(5))), scheduler
+
+    results, scheduler = asyncio.run(scenario())
+    assert results == [429] * 5
+    assert scheduler.rejected == 1
+    assert FakeCompletion.calls == 0
@@ -0,0 +1,64 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from backend.live_transcription import LiveTranscription, FFmpegStreamDecoder
+from backend.transcription import SAMPLE_RATE, TranscriptionError
+
+SPEECH = (0.3 * np.sin(np.arange(SAMPLE_RATE) / 3)).astype(np.float32)
+SILENCE = np.zeros(SAMPLE_RATE, dtype=np.float32)
+
+
+class FakeTranscriber:
+    async def transcribe(self, audio, timings=None):
+        return "текст"
+
+
+def _events(*chunks):
+    async def scenario():
+        events = []
+
+        async def send(event):
+            events.append(event)
+
+        live = LiveTranscription(FakeTranscriber(), send, partial_interval=60)
+        for chunk in chunks:
+            await live.feed(chunk)
+        await live.finish()
+        return [(event["type"], event["segment"]) for event in events]
+
+    return asyncio.run(scenario())
+
+
+def test_speech_start_is_sent_for_each_segment():
+    events = _events(SPEECH, SILENCE, SPEECH)
+    assert ("speech_start", 0) in events and ("speech_start", 1) in events
+
+
+def test_segment_starting_in_the_same_chunk_gets_speech_start():
+    # Конец первого сегмента и начало второго приходят одним куском
+    events = _events(SPEECH, np.concatenate((SILENCE, SPEECH)))
+    assert [event for event in events if event[0] == "speech_start"] == [("speech_start", 0), ("speech_start", 1)]
+    assert [event for event in events if event[0] == "final"] == [("final", 0), ("final", 1)]
+
+
+def test_decoder_write_raises_when_samples_handler_fails():
+    async def scenario():
+        async def on_samples(samples):
+            raise TranscriptionError("Streaming session is too long")
+
+        decoder = FFmpegStreamDecoder(on_samples)
+        # Трубу ffmpeg заменяет cat: проверяется чтение и запись, а не декодирование
+        decoder._process = await asyncio.create_subprocess_exec(
+            "cat", stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+        )
+        decoder._reader = asyncio.create_task(decoder._read())
+        try:
+            with pytest.raises(TranscriptionError, match="too long"):
+                for _ in range(1000):
+                    await asyncio.wait_for(decoder.write(b"\0" * 65536), 5)
+        finally:
+            await asyncio.wait_for(decoder.close(), 5)
+
+    asyncio.run(scenario())
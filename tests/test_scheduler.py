@@ -0,0 +1,162 @@
+import asyncio
+
+import pytest
+
+from backend.scheduler import (
+    LLMScheduler, QueueFullError, QueueTimeoutError,
+    PRIORITY_VOICE, PRIORITY_CHAT, PRIORITY_BACKGROUND,
+)
+
+
+async def _settle():
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+def test_waiters_are_served_by_priority_then_arrival():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=10)
+        await scheduler.acquire()
+        order = []
+
+        async def call(name, priority):
+            await scheduler.acquire(priority, timeout=5)
+            order.append(name)
+            scheduler.release()
+
+        tasks = [
+            asyncio.ensure_future(call("chat-1", PRIORITY_CHAT)),
+            asyncio.ensure_future(call("voice", PRIORITY_VOICE)),
+            asyncio.ensure_future(call("chat-2", PRIORITY_CHAT)),
+        ]
+        await _settle()
+        assert scheduler.queued == 3
+        scheduler.release()
+        await asyncio.gather(*tasks)
+        return order, scheduler
+
+    order, scheduler = asyncio.run(scenario())
+    assert order == ["voice", "chat-1", "chat-2"]
+    assert scheduler.active == 0
+    assert scheduler.admitted == 4
+
+
+def test_full_queue_rejects_with_429():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=1)
+        await scheduler.acquire()
+        waiter = asyncio.ensure_future(scheduler.acquire(timeout=5))
+        await _settle()
+        with pytest.raises(QueueFullError) as error:
+            await scheduler.acquire()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        return error.value, scheduler
+
+    error, scheduler = asyncio.run(scenario())
+    assert error.status_code == 429
+    assert error.retry_after >= 1
+    assert scheduler.rejected == 1
+
+
+def test_queue_deadline_raises_503():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=5)
+        await scheduler.acquire()
+        with pytest.raises(QueueTimeoutError) as error:
+            await scheduler.acquire(timeout=0.01)
+        return error.value, scheduler
+
+    error, scheduler = asyncio.run(scenario())
+    assert error.status_code == 503
+    assert scheduler.timeouts == 1
+    assert scheduler.queued == 0
+    assert scheduler.active == 1
+
+
+def test_cancelled_waiter_is_skipped():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=5)
+        await scheduler.acquire()
+        cancelled = asyncio.ensure_future(scheduler.acquire(timeout=5))
+        waiting = asyncio.ensure_future(scheduler.acquire(timeout=5))
+        await _settle()
+        cancelled.cancel()
+        await _settle()
+        scheduler.release()
+        await waiting
+        return scheduler
+
+    scheduler = asyncio.run(scenario())
+    assert scheduler.active == 1
+    assert scheduler.queued == 0
+
+
+def test_waiter_cancelled_after_grant_returns_the_slot():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=5)
+        await scheduler.acquire()
+        waiter = asyncio.ensure_future(scheduler.acquire(timeout=5))
+        await _settle()
+        # Слот передан ожидающему, но тот отменен раньше, чем успел проснуться
+        scheduler.release()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        return scheduler
+
+    scheduler = asyncio.run(scenario())
+    assert scheduler.active == 0
+
+
+def test_slot_releases_on_error():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=1)
+        with pytest.raises(ValueError):
+            async with scheduler.slot(PRIORITY_BACKGROUND):
+                raise ValueError("upstream")
+        return scheduler
+
+    assert asyncio.run(scenario()).active == 0
+
+
+def test_retry_after_grows_with_backlog():
+    scheduler = LLMScheduler(max_concurrency=2, max_queue=10)
+    assert scheduler.retry_after() == 1
+
+    async def scenario():
+        await scheduler.acquire()
+        await scheduler.acquire()
+        waiters = [asyncio.ensure_future(scheduler.acquire(timeout=5)) for _ in range(5)]
+        await _settle()
+        # Среднее время обслуживания 2 с: 6 запросов на 2 слота - 6 с
+        retry_after = scheduler.retry_after()
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        return retry_after
+
+    assert asyncio.run(scenario()) == 6
+
+
+def test_background_waiters_do_not_fill_the_chat_queue():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=2, max_background_queue=2)
+        await scheduler.acquire()
+        background = [
+            asyncio.ensure_future(scheduler.acquire(PRIORITY_BACKGROUND, timeout=5)) for _ in range(2)
+        ]
+        await _settle()
+        chat = asyncio.ensure_future(scheduler.acquire(PRIORITY_CHAT, timeout=5))
+        await _settle()
+        with pytest.raises(QueueFullError):
+            await scheduler.acquire(PRIORITY_BACKGROUND, timeout=5)
+        scheduler.release()
+        await chat
+        for waiter in background:
+            waiter.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        return scheduler
+
+    scheduler = asyncio.run(scenario())
+    assert scheduler.active == 1
+    assert scheduler.rejected == 1
@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+
+from backend.singleflight import SingleFlight, ReplayStream, StreamSingleFlight
+
+
+def test_followers_share_leader_result():
+    async def scenario():
+        flights = SingleFlight()
+        calls = 0
+        release = asyncio.Event()
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return "answer"
+
+        waiters = [asyncio.ensure_future(flights.do("q", fetch)) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert flights.in_flight() == 1
+        release.set()
+        results = await asyncio.gather(*waiters)
+        return calls, results, flights
+
+    calls, results, flights = asyncio.run(scenario())
+    assert calls == 1
+    assert [answer for answer, _ in results] == ["answer"] * 3
+    assert [is_leader for _, is_leader in results] == [True, False, False]
+    assert (flights.leaders, flights.followers) == (1, 2)
+    assert flights.in_flight() == 0
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    async def scenario():
+        flights = SingleFlight()
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            return "answer"
+
+        leader = asyncio.ensure_future(flights.do("q", fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flights.do("q", fetch))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        return leader, await follower
+
+    leader, (answer, is_leader) = asyncio.run(scenario())
+    assert leader.cancelled()
+    assert answer == "answer"
+    assert not is_leader
+
+
+def test_errors_reach_every_follower():
+    async def scenario():
+        flights = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0)
+            raise ValueError("upstream")
+
+        return await asyncio.gather(
+            *(flights.do("q", fail) for _ in range(2)), return_exceptions=True
+        )
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+async def _collect(stream):
+    return [chunk async for chunk in stream.subscribe()]
+
+
+def test_late_subscriber_replays_from_start():
+    async def scenario():
+        stream = ReplayStream()
+        stream.publish("a")
+        early = asyncio.ensure_future(_collect(stream))
+        await asyncio.sleep(0)
+        stream.publish("b")
+        late = asyncio.ensure_future(_collect(stream))
+        await asyncio.sleep(0)
+        stream.publish("c")
+        stream.finish(usage={"total_tokens": 3})
+        return await early, await late, stream
+
+    early, late, stream = asyncio.run(scenario())
+    assert early == late == ["a", "b", "c"]
+    assert stream.text == "abc"
+    assert stream.usage == {"total_tokens": 3}
+
+
+def test_stream_error_reaches_every_subscriber():
+    async def scenario():
+        flights = StreamSingleFlight()
+
+        async def produce(stream):
+            stream.publish("partial")
+            await asyncio.sleep(0)
+            raise RuntimeError("upstream closed")
+
+        stream, is_leader = flights.join("q", produce)
+        same, follower_is_leader = flights.join("q", produce)
+        assert same is stream and is_leader and not follower_is_leader
+
+        async def read():
+            chunks = []
+            with pytest.raises(RuntimeError, match="upstream closed"):
+                async for chunk in stream.subscribe():
+                    chunks.append(chunk)
+            return chunks
+
+        results = await asyncio.gather(read(), read())
+        await asyncio.sleep(0)
+        return results, flights
+
+    results, flights = asyncio.run(scenario())
+    assert results == [["partial"], ["partial"]]
+    assert (flights.leaders, flights.followers) == (1, 1)
+    assert flights.in_flight() == 0
@@ -0,0 +1,120 @@
+import asyncio
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from backend.storage import SQLiteMessageStore, decode_cursor
+
+BASE = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def _message(message_id, seconds, session_id="s1"):
+    return {
+        "id": message_id,
+        "session_id": session_id,
+        "role": "user",
+        "content": f"message {message_id}",
+        "timestamp": BASE + timedelta(seconds=seconds),
+    }
+
+
+def _run(path, docs, scenario):
+    async def main():
+        store = SQLiteMessageStore(str(path))
+        await store.ensure_indexes()
+        try:
+            await store.insert_many(docs)
+            return await scenario(store)
+        finally:
+            await store.close()
+    return asyncio.run(main())
+
+
+async def _all_pages(store, session_id, limit):
+    pages, cursor = [], None
+    while True:
+        rows, cursor = await store.get_page(session_id, limit, before=cursor)
+        pages.append([row["id"] for row in rows])
+        if cursor is None:
+            return pages
+
+
+def test_pages_walk_back_in_chronological_order(tmp_path):
+    docs = [_message(f"m{i}", i) for i in range(7)]
+    docs.append(_message("other", 3, session_id="s2"))
+
+    pages = _run(tmp_path / "messages.db", docs, lambda store: _all_pages(store, "s1", 3))
+
+    assert pages == [["m4", "m5", "m6"], ["m1", "m2", "m3"], ["m0"]]
+
+
+def test_last_full_page_has_no_cursor(tmp_path):
+    docs = [_message(f"m{i}", i) for i in range(4)]
+
+    async def scenario(store):
+        first = await store.get_page("s1", 2)
+        second = await store.get_page("s1", 2, before=first[1])
+        everything = await store.get_page("s1", 4)
+        return first, second, everything
+
+    first, second, everything = _run(tmp_path / "messages.db", docs, scenario)
+    assert first[1] is not None
+    assert [row["id"] for row in second[0]] == ["m0", "m1"]
+    assert second[1] is None
+    assert everything[1] is None
+
+
+def test_equal_timestamps_are_ordered_by_id(tmp_path):
+    docs = [_message(message_id, 0) for message_id in ("c", "a", "e", "b", "d")]
+    docs.append(_message("z-later", 1))
+
+    pages = _run(tmp_path / "messages.db", docs, lambda store: _all_pages(store, "s1", 2))
+
+    assert pages == [["e", "z-later"], ["c", "d"], ["a", "b"]]
+
+
+def test_cursor_points_at_oldest_message_of_page(tmp_path):
+    docs = [_message(f"m{i}", i) for i in range(3)]
+
+    _, cursor = _run(tmp_path / "messages.db", docs, lambda store: store.get_page("s1", 2))
+
+    assert decode_cursor(cursor) == (BASE + timedelta(seconds=1), "m1")
+
+
+def test_empty_session_has_no_messages(tmp_path):
+    rows, cursor = _run(tmp_path / "messages.db", [_message("m0", 0)], lambda store: store.get_page("nobody", 5))
+    assert rows == [] and cursor is None
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "W10", "WyJ4IiwgMV0"])
+def test_malformed_cursor_is_rejected(tmp_path, cursor):
+    with pytest.raises(ValueError):
+        _run(tmp_path / "messages.db", [], lambda store: store.get_page("s1", 5, before=cursor))
+
+
+def test_history_endpoint_returns_400_for_malformed_cursor(tmp_path, monkeypatch):
+    from backend import server
+
+    async def scenario(store):
+        monkeypatch.setattr(server, "message_store", store)
+        with pytest.raises(HTTPException) as error:
+            await server.get_history("s1", limit=5, cursor="not-a-cursor")
+        return error.value
+
+    error = _run(tmp_path / "messages.db", [], scenario)
+    assert error.status_code == 400
+    assert "Invalid cursor" in error.detail
+
+
+def test_close_closes_reader_connections(tmp_path):
+    async def scenario(store):
+        await asyncio.gather(*(store.get_page("s1", 1) for _ in range(4)))
+        return list(store._readers)
+
+    readers = _run(tmp_path / "messages.db", [_message("m0", 0)], scenario)
+    assert readers
+    for conn in readers:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+from backend.streaming import coalesce_deltas
+
+
+def test_buffered_text_is_flushed_during_upstream_pause():
+    async def scenario():
+        resume = asyncio.Event()
+
+        async def deltas():
+            yield "first"
+            yield "a"
+            yield "b"
+            # Апстрим замолкает: накопленный текст не должен ждать следующей дельты
+            await resume.wait()
+            yield "c"
+
+        received = []
+        started = time.monotonic()
+        async for chunk in coalesce_deltas(deltas(), interval=0.05, max_pending=1000):
+            received.append((chunk, time.monotonic() - started))
+            if chunk == "ab":
+                resume.set()
+        return received
+
+    received = asyncio.run(scenario())
+    assert [chunk for chunk, _ in received] == ["first", "ab", "c"]
+    assert received[1][1] < 1
+
+
+def test_max_pending_flushes_immediately_and_tail_is_kept():
+    async def scenario():
+        async def deltas():
+            for delta in ["x", "12", "34", "5"]:
+                yield delta
+
+        return [chunk async for chunk in coalesce_deltas(deltas(), interval=60, max_pending=4)]
+
+    assert asyncio.run(scenario()) == ["x", "1234", "5"]
+
+
+def test_closing_the_consumer_cancels_the_pending_read():
+    async def scenario():
+        closed = asyncio.Event()
+
+        async def deltas():
+            try:
+                yield "first"
+                await asyncio.Event().wait()
+            finally:
+                closed.set()
+
+        chunks = coalesce_deltas(deltas(), interval=0.01)
+        assert await chunks.__anext__() == "first"
+        reader = asyncio.ensure_future(chunks.__anext__())
+        await asyncio.sleep(0.02)
+        reader.cancel()
+        await asyncio.gather(reader, return_exceptions=True)
+        await chunks.aclose()
+        await asyncio.wait_for(closed.wait(), 1)
+
+    asyncio.run(scenario())
@@ -0,0 +1,45 @@
+import pytest
+
+from backend import tokens
+
+pytestmark = pytest.mark.skipif(not tokens.TIKTOKEN_AVAILABLE, reason="tiktoken not installed")
+
+
+class FakeEncoding:
+    def encode(self, text, disallowed_special=()):
+        return text.split()
+
+
+@pytest.fixture
+def flaky_download(monkeypatch):
+    attempts = []
+
+    def encoding_for_model(model):
+        attempts.append(model)
+        if len(attempts) == 1:
+            raise OSError("download failed")
+        return FakeEncoding()
+
+    monkeypatch.setattr(tokens.tiktoken, "encoding_for_model", encoding_for_model)
+    monkeypatch.setattr(tokens, "_encodings", {})
+    monkeypatch.setattr(tokens, "_failed_at", {})
+    return attempts
+
+
+def test_failed_load_raises_and_is_retried(flaky_download):
+    with pytest.raises(OSError):
+        tokens.get_encoding("test-model")
+    assert isinstance(tokens.get_encoding("test-model"), FakeEncoding)
+    tokens.get_encoding("test-model")
+    assert len(flaky_download) == 2
+
+
+def test_count_tokens_falls_back_and_retries_after_interval(flaky_download, monkeypatch):
+    assert tokens.count_tokens("один два три", "test-model") == 5
+    # В пределах интервала повторной загрузки не делается
+    assert tokens.count_tokens("один два три", "test-model") == 5
+    assert len(flaky_download) == 1
+
+    monkeypatch.setattr(tokens, "ENCODING_RETRY_INTERVAL", 0)
+    assert tokens.count_tokens("один два три", "test-model") == 3
+    assert len(flaky_download) == 2
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from backend.topic import TOPIC_EXAMPLES_PATH, get_topic_classifier
+
+# Вопросы не входят в topic_examples.json: проверяется обобщение, а не память
+HELD_OUT_ON_TOPIC = [
+    "какой флаг",
+    "какой герб",
+    "какой гимн",
+    "какая столица",
+    "русский язык",
+    "церковь",
+    "сколько длится отпуск",
+    "экология",
+    "Какой у нас флаг?",
+    "Что изображено на гербе?",
+    "Где находится столица?",
+    "На каком языке говорят в Беларуси?",
+    "Можно ли ходить в церковь?",
+    "Сколько дней отпуска положено?",
+    "Кто охраняет природу?",
+    "Можно ли служить в армии?",
+    "Бесплатная ли учеба в вузе?",
+    "Пенсия по старости",
+    "Можно ли митинговать?",
+]
+
+HELD_OUT_OFF_TOPIC = [
+    "Как сварить суп из грибов?",
+    "Напиши стихотворение про кошку",
+    "Как научиться играть на гитаре?",
+    "Кто снял фильм Титаник?",
+]
+
+
+def test_held_out_questions_are_not_training_examples():
+    with open(TOPIC_EXAMPLES_PATH, encoding="utf-8") as f:
+        examples = json.load(f)
+    seen = {text.lower() for text in examples["on_topic"] + examples["off_topic"]}
+    assert not seen & {text.lower() for text in HELD_OUT_ON_TOPIC + HELD_OUT_OFF_TOPIC}
+
+
+@pytest.mark.parametrize("question", HELD_OUT_ON_TOPIC)
+def test_constitution_questions_are_never_refused(question):
+    off_topic, _ = get_topic_classifier().is_off_topic(question)
+    assert not off_topic
+
+
+@pytest.mark.parametrize("question", HELD_OUT_OFF_TOPIC)
+def test_obvious_off_topic_questions_are_refused(question):
+    off_topic, score = get_topic_classifier().is_off_topic(question)
+    assert off_topic and score >= 0.9
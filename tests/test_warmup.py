@@ -0,0 +1,45 @@
+import os
+import sys
+import asyncio
+import subprocess
+
+from backend import server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_requests_do_not_wait_for_whisper(monkeypatch):
+    async def scenario():
+        whisper_loading = asyncio.Event()
+        monkeypatch.setattr(server, "serving_ready", asyncio.Event())
+        monkeypatch.setattr(server, "warmup_task", asyncio.ensure_future(whisper_loading.wait()))
+
+        waiting = asyncio.ensure_future(server.wait_for_warmup(timeout=5))
+        await asyncio.sleep(0)
+        assert not waiting.done()
+        # Индексы и токенизатор готовы, Whisper еще грузится
+        server.serving_ready.set()
+        ready = await asyncio.wait_for(waiting, 1)
+        whisper_loading.set()
+        await server.warmup_task
+        return ready
+
+    assert asyncio.run(scenario())
+
+
+def test_warmup_wait_times_out(monkeypatch):
+    async def scenario():
+        monkeypatch.setattr(server, "serving_ready", asyncio.Event())
+        monkeypatch.setattr(server, "warmup_task", asyncio.ensure_future(asyncio.sleep(5)))
+        ready = await server.wait_for_warmup(timeout=0.01)
+        server.warmup_task.cancel()
+        await asyncio.gather(server.warmup_task, return_exceptions=True)
+        return ready
+
+    assert asyncio.run(scenario()) is False
+
+
+def test_server_import_does_not_load_numpy():
+    # Отдельный процесс: в этом numpy уже загружен другими тестами
+    code = "import sys, backend.server; sys.exit('numpy' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True).returncode == 0